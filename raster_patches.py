@@ -4,21 +4,55 @@ import rasterio
 from rasterio.features import shapes
 import geopandas as gpd
 import pandas as pd
-from shapely.geometry import Polygon
-from shapely.ops import unary_union
+from shapely.geometry import box
+from shapely import STRtree
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+import shapely
+import numpy as np
 import multiprocessing
+import threading
+import tempfile
+import shutil
 import time
+import json
+import hashlib
 from tqdm import tqdm
 from itertools import chain
 
+MIN_POLYGON_AREA = 0.01  # Polygons of a tile at or below this area (map units) are dropped
+MERGE_MIN_AREA = 0.1  # Patches at or below this area are dropped before merging
+POLYGONIZE_SETTINGS = {'connectivity': 8, 'min_area': MIN_POLYGON_AREA, 'holes': True, 'value': True}
+
+def peak_rss_mb():
+    """Peak resident memory of the current process in MB (None if it cannot be read)."""
+    try:
+        import resource  # Unix: ru_maxrss is in kB on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    except ImportError:
+        try:
+            import psutil  # Windows: peak working set
+            return psutil.Process().memory_info().peak_wset / 2**20
+        except Exception:
+            return None
+
 class TicToc:
-    """Enhanced timer with memory monitoring"""
+    """
+    Enhanced timer with memory monitoring.
+
+    Besides wall-clock laps it collects per-tile worker stats (add_tile) and per-level merge
+    timings (add_merge_level); report() bundles everything into a JSON-ready dict and
+    get_summary() into a printable text.
+    """
     def __init__(self):
         self.reset()
     
     def reset(self):
         self.start_time = None
         self.laps = []
+        self.tiles = []
+        self.merge_levels = []
+        self.params = {}
     
     def tic(self):
         self.reset()
@@ -35,7 +69,7 @@ class TicToc:
     def print_lap(self, message=""):
         elapsed = self.lap(message)
         ram = self.get_memory_usage()
-        print(f"\n{message}: {elapsed:.2f}s | RAM: {ram}%")
+        print(f"\n{message}: {elapsed:.2f}s | RAM: {ram}")
         return elapsed
     
     def get_memory_usage(self):
@@ -44,8 +78,176 @@ class TicToc:
             return f"{psutil.virtual_memory().percent}%"
         except:
             return "N/A"
+    
+    def add_tile(self, stats):
+        """Records the stats dict of one tile (see _process_tile_keyed)."""
+        self.tiles.append(stats)
+    
+    def add_merge_level(self, **stats):
+        """Records one dissolve level (level, grid, groups, geometries in/out, seconds)."""
+        self.merge_levels.append(stats)
+    
+    def report(self):
+        """All collected measurements as a JSON-serialisable dict."""
+        stages, previous = [], 0.0
+        for name, elapsed in self.laps:
+            stages.append({'stage': name, 'seconds': round(elapsed - previous, 3)})
+            previous = elapsed
+
+        tiles = {}
+        if self.tiles:
+            df = pd.DataFrame(self.tiles)
+            phases = [col for col in ('read', 'polygonize', 'validate', 'total') if col in df]
+            tiles = {
+                'count': len(df),
+                'seconds': {col: {'sum': round(df[col].sum(), 3), 'mean': round(df[col].mean(), 4),
+                                  'p95': round(df[col].quantile(0.95), 4), 'max': round(df[col].max(), 4)}
+                            for col in phases},
+                'polygons': int(df['polygons'].sum()),
+                'failed': df.loc[df['error'].notna(), 'tile'].tolist() if 'error' in df else [],
+                'slowest': df.nlargest(5, 'total')[['tile', 'total']].round(3).to_dict('records'),
+                # Workers are long-lived, so peak RSS is per worker process, not per tile
+                'workers': [{'pid': int(pid), 'tiles': len(g), 'busy_seconds': round(g['total'].sum(), 3),
+                             'peak_rss_mb': round(g['peak_rss_mb'].max(), 1) if g['peak_rss_mb'].notna().any() else None}
+                            for pid, g in df.groupby('pid')],
+            }
+
+        parent_rss = peak_rss_mb()
+        return {
+            'params': self.params,
+            'total_seconds': round(self.toc(), 3) if self.start_time else None,
+            'stages': stages,
+            'tiles': tiles,
+            'merge_levels': self.merge_levels,
+            'peak_rss_mb': round(parent_rss, 1) if parent_rss is not None else None,
+        }
+    
+    def save_report(self, path):
+        """Writes report() as JSON to `path`."""
+        with open(path, "w") as f:
+            json.dump(self.report(), f, indent=2, default=str)
+        return path
+    
+    def get_summary(self):
+        """Printable summary of stages, tile phases, workers and merge levels."""
+        report = self.report()
+        lines = ["", f"Run summary ({report['total_seconds']}s total, parent peak RSS {report['peak_rss_mb']} MB)"]
+        for stage in report['stages']:
+            lines.append(f"  {stage['stage']:<30} {stage['seconds']:>10.2f}s")
+        tiles = report['tiles']
+        if tiles:
+            lines.append(f"Tiles: {tiles['count']} processed, {tiles['polygons']} polygons, {len(tiles['failed'])} failed")
+            for phase, sec in tiles['seconds'].items():
+                lines.append(f"  {phase:<12} sum {sec['sum']:>9.2f}s  mean {sec['mean']:>7.3f}s  "
+                             f"p95 {sec['p95']:>7.3f}s  max {sec['max']:>7.3f}s")
+            for worker in tiles['workers']:
+                lines.append(f"  worker {worker['pid']:<8} {worker['tiles']:>6} tiles  busy {worker['busy_seconds']:>8.2f}s  "
+                             f"peak RSS {worker['peak_rss_mb']} MB")
+        for level in report['merge_levels']:
+            lines.append(f"Merge level {level['level']} ({level['grid']}x{level['grid']}): {level['groups']} groups, "
+                         f"{level['geometries_in']} -> {level['geometries_out']} geometries in {level['seconds']:.2f}s")
+        return "\n".join(lines)
             
 
+class PolygonSpool:
+    """
+    On-disk spool of per-tile polygon results (one GeoParquet part per tile).
+
+    Temporary by default. With `directory` it is persistent and content-addressed: parts are
+    named by tile key (see tile_key), tiles without polygons leave an empty marker, and a
+    restarted run can skip every tile the spool already holds.
+    """
+    def __init__(self, parent_dir=None, directory=None):
+        self.persistent = directory is not None
+        if self.persistent:
+            os.makedirs(directory, exist_ok=True)
+            self.directory = directory
+        else:
+            if parent_dir:
+                os.makedirs(parent_dir, exist_ok=True)
+            self.directory = tempfile.mkdtemp(prefix="polygon_spool_", dir=parent_dir)
+        self.parts = []
+    
+    def __len__(self):
+        return len(self.parts)
+    
+    def part_path(self, key):
+        return os.path.join(self.directory, f"{key}.parquet")
+    
+    def has(self, key):
+        return os.path.exists(self.part_path(key)) or os.path.exists(self.part_path(key) + ".empty")
+    
+    def add(self, gdf, key=None):
+        key = key or f"part_{len(self.parts):06d}"
+        path = self.part_path(key)
+        if gdf is None:
+            if self.persistent:
+                open(path + ".empty", "w").close()
+            return
+        # Write then rename, so a crash never leaves a truncated part behind
+        gdf.to_parquet(path + ".tmp")
+        os.replace(path + ".tmp", path)
+        self.parts.append(path)
+    
+    def select(self, keys):
+        """Iterates over the parts of `keys` (in that order), including parts of earlier runs."""
+        self.parts = [self.part_path(key) for key in keys if os.path.exists(self.part_path(key))]
+    
+    def __iter__(self):
+        for path in self.parts:
+            yield gpd.read_parquet(path)
+    
+    def cleanup(self):
+        if not self.persistent:
+            shutil.rmtree(self.directory, ignore_errors=True)
+            self.parts = []
+
+def tile_key(file_path):
+    """Content address of a tile's polygons: path, mtime, size and polygonization settings (not tolerance)."""
+    stat = os.stat(file_path)
+    payload = [os.path.abspath(file_path), stat.st_mtime_ns, stat.st_size, POLYGONIZE_SETTINGS]
+    return hashlib.sha1(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+def merge_key(tile_keys, **settings):
+    """Content address of a merge: the tiles it consumes plus every setting that changes its result."""
+    payload = [sorted(tile_keys), settings, MERGE_MIN_AREA]
+    return hashlib.sha1(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+def write_manifest(checkpoint_dir, **entries):
+    """Updates the run manifest (manifest.json) of a checkpoint directory."""
+    path = os.path.join(checkpoint_dir, "manifest.json")
+    manifest = {}
+    if os.path.exists(path):
+        with open(path) as f:
+            manifest = json.load(f)
+    manifest.update(entries, updated=time.strftime("%Y-%m-%d %H:%M:%S"))
+    with open(path + ".tmp", "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(path + ".tmp", path)
+
+def _process_tile_keyed(file_path):
+    """Pool task: (file_path, process_tile result, stats), so results can be filed under their tile key."""
+    stats = {'tile': os.path.basename(file_path), 'pid': os.getpid()}
+    start = time.perf_counter()
+    gdf = process_tile(file_path, stats)
+    stats['total'] = time.perf_counter() - start
+    stats['polygons'] = stats.get('polygons', 0)
+    stats['peak_rss_mb'] = peak_rss_mb()
+    return file_path, gdf, stats
+
+def throttle(items, semaphore, stop):
+    """
+    Feeds tile paths to the pool only while fewer than batch_size tiles are in flight.
+
+    Every path takes a slot of `semaphore`, which the main loop gives back once the tile's
+    polygons are in the spool. Stops early when `stop` is set (the loop ended or failed).
+    """
+    for item in items:
+        while not semaphore.acquire(timeout=0.5):
+            if stop.is_set():
+                return
+        yield item
+
 def get_driver_from_path(path):
     """Robust format detection from file extension"""
     ext = os.path.splitext(path)[1].lower()
@@ -63,76 +265,227 @@ def get_driver_from_path(path):
         )
     return driver
 
-def process_tile(file_path):
-    """Process single tile with robust geometry handling"""
+def shapes_to_polygons(all_shapes):
+    """
+    Builds polygons (with holes) from rasterio.features.shapes output in bulk.
+
+    All ring coordinates are gathered into one array and handed to shapely's array
+    constructors (linearrings/polygons with ring and polygon indices), so no Polygon is
+    built in a Python loop. Returns (polygons, values) as numpy arrays.
+    """
+    if not all_shapes:
+        return np.empty(0, dtype=object), np.empty(0)
+    rings = [ring for geom, _ in all_shapes for ring in geom['coordinates']]
+    ring_sizes = np.fromiter((len(ring) for ring in rings), dtype=np.int64, count=len(rings))
+    rings_per_polygon = np.fromiter((len(geom['coordinates']) for geom, _ in all_shapes),
+                                    dtype=np.int64, count=len(all_shapes))
+
+    coords = np.concatenate([np.asarray(ring, dtype=float) for ring in rings])
+    linear_rings = shapely.linearrings(coords, indices=np.repeat(np.arange(len(rings)), ring_sizes))
+    # First ring of each polygon is its shell, the following ones its holes
+    polygons = shapely.polygons(linear_rings, indices=np.repeat(np.arange(len(all_shapes)), rings_per_polygon))
+    values = np.array([val for _, val in all_shapes])
+    return polygons, values
+
+def polygonal_parts(geoms):
+    """Replaces every GeometryCollection by a MultiPolygon of its polygonal parts (empty if it has none)."""
+    collections = np.flatnonzero(shapely.get_type_id(geoms) == 7)
+    if not collections.size:
+        return geoms
+    members, owner = shapely.get_parts(geoms[collections], return_index=True)
+    areal = np.isin(shapely.get_type_id(members), (3, 6))
+    parts, part_owner = shapely.get_parts(members[areal], return_index=True)
+    owner = owner[areal][part_owner]
+    geoms = geoms.copy()
+    geoms[collections] = shapely.Polygon()
+    if parts.size:
+        rows, owner = np.unique(owner, return_inverse=True)
+        geoms[collections[rows]] = shapely.multipolygons(parts, indices=owner)
+    return geoms
+
+def process_tile(file_path, stats=None):
+    """
+    Process single tile with robust geometry handling (holes and raster value kept).
+
+    If a `stats` dict is given, it receives the read/polygonize/validate seconds and the
+    number of polygons kept, or the message of the exception under 'error' if the tile failed
+    (None is returned both for a failed tile and for one without polygons).
+    """
+    stats = {} if stats is None else stats
     try:
+        start = time.perf_counter()
         with rasterio.open(file_path) as src:
             image = src.read(1)
             mask = image != src.nodata
+            stats['read'] = time.perf_counter() - start
             all_shapes = list(shapes(image, mask=mask, 
                                   transform=src.transform, 
                                   connectivity=8))  # Queen's case
 
-        polygons = []
-        for geom, val in all_shapes:
-            try:
-                poly = Polygon(geom['coordinates'][0])
-                if not poly.is_valid:
-                    poly = poly.buffer(0)
-                if poly.is_valid and poly.area > 0.01:  # Skip tiny polygons
-                    polygons.append(poly)
-            except:
-                continue
+        polygons, values = shapes_to_polygons(all_shapes)
+        stats['polygonize'] = time.perf_counter() - start - stats['read']
+        
+        # 8-connected rings often touch themselves at a corner; buffer(0) repairs those with the same
+        # area as make_valid at a fraction of its cost. Collections keep their polygonal parts.
+        invalid = ~shapely.is_valid(polygons)
+        if invalid.any():
+            polygons[invalid] = shapely.buffer(polygons[invalid], 0)
+        polygons = polygonal_parts(polygons)
+        keep = (np.isin(shapely.get_type_id(polygons), (3, 6))  # Polygon, MultiPolygon
+                & (shapely.area(polygons) > MIN_POLYGON_AREA))  # Skip tiny polygons
+        stats['validate'] = time.perf_counter() - start - stats['read'] - stats['polygonize']
+        stats['polygons'] = int(keep.sum())
 
-        return gpd.GeoDataFrame({'geometry': polygons}, crs=src.crs) if polygons else None
+        if not keep.any():
+            return None
+        return gpd.GeoDataFrame({'VALUE': values[keep].astype(image.dtype), 'geometry': polygons[keep]}, crs=src.crs)
     
     except Exception as e:
         print(f"\nTile error: {os.path.basename(file_path)} - {str(e)}")
+        stats['error'] = str(e)
         return None
 
-def merge_in_chunks(gdf_list, tolerance=1.0, chunk_size=1000):
-    """Memory-efficient merging with fail-safes"""
-    if not gdf_list:
-        return gpd.GeoDataFrame()
-    
-    # CRS validation
-    if len({gdf.crs for gdf in gdf_list}) > 1:
-        raise ValueError("Mixed CRS detected in input tiles")
-    
-    # 1. Simplify and filter geometries first
+def _union_wkb(args):
+    """Pool task: unions one group of WKB geometries and returns the WKB of the result."""
+    wkb, coverage = args
+    geoms = shapely.from_wkb(wkb)
+    merged = shapely.coverage_union_all(geoms) if coverage else shapely.union_all(geoms)
+    return shapely.to_wkb(merged)
+
+def dissolve_tree(geoms, chunk_size=1000, num_processes=None, coverage=False, checkpoint=None, timer=None):
+    """
+    Hierarchical union of geometries grouped in spatial grid buckets.
+
+    Level 0 buckets hold about `chunk_size` geometries (grid over their bbox centres); every
+    level unions its buckets in a process pool and halves the grid, until one bucket is left.
+    Each union only sees neighbouring geometries, so the cost stays close to linear instead of
+    the quadratic growth of folding everything into one growing geometry.
+
+    Args:
+        geoms: Sequence of shapely geometries
+        chunk_size: Target number of geometries per level-0 bucket (default 1000)
+        num_processes: Number of processes per level (default None meaning all cores, 1 = in-process)
+        coverage: Whether the input is a coverage (no overlapping interiors); enables the much
+                  faster shapely.coverage_union_all at every level
+        checkpoint: Path prefix; every completed level is saved as <prefix>_level<n>.parquet
+                    (the result as <prefix>_final.parquet) and a rerun resumes from the last one
+        timer: Optional TicToc receiving the timing of every level (add_merge_level)
+
+    Returns:
+        Single (multi)polygon, or None if there is nothing to merge.
+    """
+    geoms = np.asarray(geoms, dtype=object)
+    geoms = geoms[~(shapely.is_missing(geoms) | shapely.is_empty(geoms))]
+    if geoms.size == 0:
+        return None
+
+    bounds = shapely.bounds(geoms)
+    centres = np.column_stack(((bounds[:, 0] + bounds[:, 2]) / 2, (bounds[:, 1] + bounds[:, 3]) / 2))
+    minx, miny = bounds[:, 0].min(), bounds[:, 1].min()
+    span = max(bounds[:, 2].max() - minx, bounds[:, 3].max() - miny) or 1.0
+    grid = max(1, int(np.ceil(np.sqrt(geoms.size / chunk_size))))
+    wkb = shapely.to_wkb(geoms)
+    level = 0
+
+    if checkpoint is not None:
+        if os.path.exists(f"{checkpoint}_final.parquet"):
+            print("\nReusing checkpointed merge result")
+            final = pd.read_parquet(f"{checkpoint}_final.parquet")['wkb']
+            return shapely.from_wkb(final.iloc[0]) if len(final) else None
+        saved = sorted(glob.glob(f"{checkpoint}_level*.parquet"),
+                       key=lambda p: int(p.rsplit("_level", 1)[1].split(".")[0]))
+        if saved:
+            state = pd.read_parquet(saved[-1])
+            level = int(saved[-1].rsplit("_level", 1)[1].split(".")[0])
+            wkb = state['wkb'].to_numpy(dtype=object)
+            centres = state[['cx', 'cy']].to_numpy()
+            grid = int(state['grid'].iloc[0])
+            print(f"\nResuming merge at level {level} ({len(wkb)} geometries)")
+
+    num_processes = num_processes or multiprocessing.cpu_count()
+    pool = multiprocessing.Pool(num_processes) if num_processes > 1 else None
+    try:
+        while True:
+            # Bucket by grid cell of the bbox centre
+            cells = np.minimum((centres - (minx, miny)) / span * grid, grid - 1).astype(np.int64)
+            cell_id = cells[:, 1] * grid + cells[:, 0]
+            order = np.argsort(cell_id, kind="stable")
+            splits = np.flatnonzero(np.diff(cell_id[order])) + 1
+            groups = np.split(order, splits)
+
+            level_start = time.perf_counter()
+            tasks = [(wkb[idx], coverage) for idx in groups]
+            imap = pool.imap(_union_wkb, tasks) if pool is not None and len(tasks) > 1 else map(_union_wkb, tasks)
+            merged_wkb = list(tqdm(imap, total=len(tasks), desc=f"Merging level {level} ({grid}x{grid})", leave=False))
+
+            merged = shapely.from_wkb(merged_wkb)
+            keep = ~shapely.is_empty(merged)
+            if timer is not None:
+                timer.add_merge_level(level=level, grid=grid, groups=len(groups), geometries_in=len(wkb),
+                                      geometries_out=int(keep.sum()),
+                                      seconds=round(time.perf_counter() - level_start, 3))
+            if grid == 1 or keep.sum() <= 1:
+                if checkpoint is not None:
+                    pd.DataFrame({'wkb': np.asarray(merged_wkb, dtype=object)[keep][:1]}).to_parquet(
+                        f"{checkpoint}_final.parquet")
+                return merged[keep][0] if keep.any() else None
+
+            wkb = np.asarray(merged_wkb, dtype=object)[keep]
+            centres = np.array([centres[idx].mean(axis=0) for idx in groups])[keep]
+            grid = int(np.ceil(grid / 2))
+            level += 1
+            if checkpoint is not None:
+                pd.DataFrame({'wkb': wkb, 'cx': centres[:, 0], 'cy': centres[:, 1], 'grid': grid}).to_parquet(
+                    f"{checkpoint}_level{level}.parquet")
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+def simplify_tiles(gdf_list, tolerance=1.0):
+    """Drops patches of MERGE_MIN_AREA map units or less and simplifies the rest, tile by tile (GeoSeries per tile)."""
     simplified = []
-    with tqdm(gdf_list, desc="Simplifying") as pbar:
+    total = len(gdf_list) if hasattr(gdf_list, "__len__") else None
+    with tqdm(total=total, desc="Simplifying") as pbar:
         for gdf in gdf_list:
             try:
-                simplified_gdf = gdf[gdf.geometry.area > 0.1].simplify(tolerance)
+                simplified_gdf = gdf[gdf.geometry.area > MERGE_MIN_AREA].simplify(tolerance)
                 simplified.append(simplified_gdf)
             except Exception as e:
                 print(f"Skipping problematic tile: {str(e)}")
             pbar.update(1)
+    return simplified
+
+def check_crs(series_list):
+    """Returns the common CRS of the simplified tiles; raises on mixed CRS."""
+    crs_set = {series.crs for series in series_list}
+    if len(crs_set) > 1:
+        raise ValueError("Mixed CRS detected in input tiles")
+    return crs_set.pop()
+
+def tile_footprint(file_path):
+    """Footprint polygon of a raster tile, from its transform and size (header only)."""
+    with rasterio.open(file_path) as src:
+        return box(*src.bounds)
+
+def merge_in_chunks(gdf_list, tolerance=1.0, chunk_size=1000, num_processes=None, coverage=False, checkpoint=None,
+                    timer=None):
+    """Memory-efficient merging with fail-safes (hierarchical, parallel dissolve)"""
+    # 1. Simplify and filter geometries first (gdf_list may be a one-pass iterable, e.g. a PolygonSpool)
+    simplified = simplify_tiles(gdf_list, tolerance)
     
     if not simplified:
         return gpd.GeoDataFrame()
     
-    # 2. Process in smaller chunks with progress
-    chunk_size = chunk_size 
+    # CRS validation
+    crs = check_crs(simplified)
+    
+    # 2. Hierarchical (tree) union of spatially grouped chunks
     all_geoms = list(chain.from_iterable(
         gdf.geometry.tolist() for gdf in simplified
     ))
     
-    merged = None
-    with tqdm(total=len(all_geoms), desc="Merging") as pbar:
-        for i in range(0, len(all_geoms), chunk_size):
-            chunk = all_geoms[i:i + chunk_size]
-            try:
-                chunk_union = unary_union(chunk)
-                if merged is None:
-                    merged = chunk_union
-                else:
-                    merged = merged.union(chunk_union)
-                pbar.update(len(chunk))
-            except Exception as e:
-                print(f"\nChunk {i//chunk_size} failed: {str(e)}")
-                continue
+    merged = dissolve_tree(all_geoms, chunk_size, num_processes, coverage, checkpoint, timer)
     
     # 3. Final processing with timeout
     if merged is None:
@@ -142,7 +495,7 @@ def merge_in_chunks(gdf_list, tolerance=1.0, chunk_size=1000):
         try:
             result = gpd.GeoDataFrame(
                 geometry=gpd.GeoSeries(merged).explode(index_parts=True),
-                crs=gdf_list[0].crs
+                crs=crs
             )
             pbar.update(1)
             return result[result.geometry.is_valid & ~result.geometry.is_empty]
@@ -150,35 +503,267 @@ def merge_in_chunks(gdf_list, tolerance=1.0, chunk_size=1000):
             print(f"\nFinal processing failed: {str(e)}")
             return gpd.GeoDataFrame() 
 
+def merge_seams(gdf_list, footprints, tolerance=1.0, chunk_size=1000, num_processes=None, checkpoint=None,
+                timer=None):
+    """
+    Seam-aware merging: only patches on tile seams go through the global dissolve.
+
+    Patches are simplified and dissolved within their own tile first. A tile patch lying
+    within `tolerance` of a tile edge, or of more than one tile footprint (overlap strips),
+    may continue in a neighbouring tile and is dissolved with dissolve_tree; all other
+    patches are already final and kept as they are. The result matches merge_in_chunks,
+    at a cost that follows the seam length instead of the patch count.
+
+    Args:
+        gdf_list: GeoDataFrames of polygons, one per tile
+        footprints: Tile footprint polygons (see tile_footprint)
+        tolerance: Simplification tolerance (default 1.0)
+        chunk_size: Patches per spatial bucket of the seam dissolve (default 1000)
+        num_processes: Number of processes of the seam dissolve
+        checkpoint: Path prefix for resumable merge levels (see dissolve_tree)
+        timer: Optional TicToc receiving per-level merge timings
+
+    Returns:
+        GeoDataFrame of merged single-part polygons.
+    """
+    # 1. Simplify, then dissolve each tile on its own (local and cheap)
+    simplified = simplify_tiles(gdf_list, tolerance)
+    if not simplified:
+        return gpd.GeoDataFrame()
+    crs = check_crs(simplified)
+    tile_parts = [
+        shapely.get_parts(shapely.union_all(gdf.values)) for gdf in simplified if len(gdf)
+    ]
+    if not tile_parts:
+        return gpd.GeoDataFrame()
+    geoms = np.concatenate(tile_parts)
+    
+    # 2. Classify: seam patches are near a tile edge or near more than one footprint
+    footprints = np.asarray(footprints, dtype=object)
+    near_tile, _ = STRtree(footprints).query(geoms, predicate="dwithin", distance=tolerance)
+    near_edge, _ = STRtree(shapely.boundary(footprints)).query(geoms, predicate="dwithin", distance=tolerance)
+    seam = np.bincount(near_tile, minlength=geoms.size) > 1
+    seam[near_edge] = True
+    print(f"\nSeam patches: {seam.sum()} of {geoms.size} ({seam.mean():.1%})")
+    
+    # 3. Dissolve only the seam patches
+    merged = dissolve_tree(geoms[seam], chunk_size, num_processes, checkpoint=checkpoint, timer=timer)
+    merged_parts = shapely.get_parts(merged) if merged is not None else np.empty(0, dtype=object)
+    
+    result = gpd.GeoDataFrame(
+        geometry=np.concatenate([geoms[~seam], merged_parts]),
+        crs=crs
+    )
+    return result[result.geometry.is_valid & ~result.geometry.is_empty].reset_index(drop=True)
+
+def merge_by_value(gdf_list, tolerance=1.0, chunk_size=1000, num_processes=None, explode=False, timer=None):
+    """
+    Dissolves touching patches that share the same raster value (categorical rasters).
+
+    An STRtree over all patches finds intersecting candidates; pairs with equal VALUE become
+    edges of a graph whose connected components are the dissolve groups. Singletons pass
+    through untouched, small groups are unioned in a process pool (largest first), groups of
+    more than `chunk_size` patches go through dissolve_tree.
+
+    Args:
+        gdf_list: Iterable of per-tile GeoDataFrames with a VALUE column (e.g. a PolygonSpool)
+        tolerance: Simplification tolerance applied per tile before merging (default 1.0)
+        chunk_size: Groups larger than this are dissolved hierarchically (default 1000)
+        num_processes: Number of processes (default None meaning all cores, 1 = in-process)
+        explode: False returns one (multi)polygon per value, True one polygon per row
+        timer: Optional TicToc receiving the merge levels of large groups
+
+    Returns:
+        GeoDataFrame with VALUE, AREA and geometry columns.
+    """
+    # 1. Filter and simplify tile by tile, keeping the value of every patch
+    values, parts, crs_set = [], [], set()
+    for gdf in tqdm(gdf_list, desc="Simplifying"):
+        gdf = gdf[gdf.geometry.area > MERGE_MIN_AREA]
+        values.append(gdf['VALUE'].to_numpy())
+        parts.append(gdf.geometry.simplify(tolerance).to_numpy())
+        crs_set.add(gdf.crs)
+    if len(crs_set) > 1:
+        raise ValueError("Mixed CRS detected in input tiles")
+    if not parts:
+        return gpd.GeoDataFrame()
+    crs = crs_set.pop()
+    values, geoms = np.concatenate(values), np.concatenate(parts)
+    valid = ~(shapely.is_missing(geoms) | shapely.is_empty(geoms))
+    values, geoms = values[valid], geoms[valid]
+    if geoms.size == 0:
+        return gpd.GeoDataFrame()
+
+    # 2. Same-value neighbours -> connected components
+    left, right = STRtree(geoms).query(geoms, predicate="intersects")
+    same = (left < right) & (values[left] == values[right])
+    graph = coo_matrix((np.ones(same.sum(), dtype=np.int8), (left[same], right[same])),
+                       shape=(geoms.size, geoms.size))
+    _, component = connected_components(graph, directed=False)
+    order = np.argsort(component, kind="stable")
+    groups = np.split(order, np.flatnonzero(np.diff(component[order])) + 1)
+    print(f"\nValue groups: {len(groups)} from {geoms.size} patches")
+
+    # 3. Union each multi-patch group; the big ones hierarchically
+    merged = geoms[[idx[0] for idx in groups]]
+    group_values = values[[idx[0] for idx in groups]]
+    small = sorted((g for g, idx in enumerate(groups) if 1 < len(idx) <= chunk_size),
+                   key=lambda g: -len(groups[g]))
+    large = [g for g, idx in enumerate(groups) if len(idx) > chunk_size]
+
+    tasks = [(shapely.to_wkb(geoms[groups[g]]), False) for g in small]
+    num_processes = num_processes or multiprocessing.cpu_count()
+    if num_processes > 1 and len(tasks) > 1:
+        with multiprocessing.Pool(num_processes) as pool:
+            merged_wkb = list(tqdm(pool.imap(_union_wkb, tasks, chunksize=16), total=len(tasks), desc="Merging values"))
+    else:
+        merged_wkb = list(tqdm(map(_union_wkb, tasks), total=len(tasks), desc="Merging values"))
+    if small:
+        merged[small] = shapely.from_wkb(merged_wkb)
+    for g in large:
+        merged[g] = dissolve_tree(geoms[groups[g]], chunk_size, num_processes, timer=timer)
+
+    # 4. One row per polygon, or one multipolygon per value. Groups of one value never touch
+    # (touching patches share a component), so their parts are collected, not unioned again
+    geometry, index = shapely.get_parts(merged, return_index=True)
+    polygonal = shapely.get_type_id(geometry) == 3  # Polygon
+    geometry, part_values = geometry[polygonal], group_values[index[polygonal]]
+    if explode:
+        result = gpd.GeoDataFrame({'VALUE': part_values}, geometry=geometry, crs=crs)
+    else:
+        unique_values, inverse = np.unique(part_values, return_inverse=True)
+        order = np.argsort(inverse, kind="stable")
+        result = gpd.GeoDataFrame({'VALUE': unique_values},
+                                  geometry=shapely.multipolygons(geometry[order], indices=inverse[order]), crs=crs)
+    result = result[result.geometry.is_valid & ~result.geometry.is_empty].reset_index(drop=True)
+    result['AREA'] = shapely.area(result.geometry.values).round(2)
+    return result
+
+def _layer_geometry_type(geometry):
+    """OGR layer geometry type for a GeoSeries (Multi* when single and multi parts are mixed)."""
+    types = set(geometry.geom_type.dropna().unique())
+    if len(types) == 1:
+        return types.pop()
+    if types and all(t.replace("Multi", "") == "Polygon" for t in types):
+        return "MultiPolygon"
+    return "Unknown"
+
+def _promote_to_multi(gdf, geometry_type):
+    """Turns single polygons into one-part MultiPolygons when the layer is declared MultiPolygon."""
+    if geometry_type != "MultiPolygon":
+        return gdf
+    geoms = gdf.geometry.values.to_numpy()
+    single = shapely.get_type_id(geoms) == 3  # Polygon
+    if not single.any():
+        return gdf
+    geoms = geoms.copy()
+    geoms[single] = shapely.multipolygons(geoms[single], indices=np.arange(single.sum()))
+    return gdf.set_geometry(gpd.GeoSeries(geoms, index=gdf.index, crs=gdf.crs), crs=gdf.crs)
+
+def write_vector_stream(gdf, output_path, driver, batch_size=100_000):
+    """
+    Writes a GeoDataFrame in feature batches through pyogrio's Arrow interface.
+
+    All batches go through one Arrow stream into a single pyogrio/GDAL session, so the
+    dataset is opened once, features are written in large transactions and the spatial
+    index (GPKG, FlatGeobuf) is built once when the layer is closed. Only one batch is
+    converted to Arrow at a time. Polygons are promoted to MultiPolygons when both occur (strict
+    formats such as FlatGeobuf reject mixed types). Falls back to appending batches with
+    GeoDataFrame.to_file when Arrow writing is unavailable (no pyarrow, or GDAL < 3.8).
+
+    Args:
+        gdf: GeoDataFrame to write
+        output_path: Output vector file (any format of get_driver_from_path)
+        driver: OGR driver name
+        batch_size: Features per batch (default 100,000)
+    """
+    geometry_type = _layer_geometry_type(gdf.geometry)
+    starts = range(0, max(len(gdf), 1), batch_size)
+    with tqdm(total=len(starts), desc="Saving output") as pbar:
+        try:
+            import pyarrow as pa
+            import pyogrio
+            if tuple(pyogrio.__gdal_version__) < (3, 8):
+                raise NotImplementedError(f"GDAL {pyogrio.__gdal_version_string__} < 3.8")
+
+            def batches():
+                for start in starts:
+                    batch = _promote_to_multi(gdf.iloc[start:start + batch_size], geometry_type)
+                    table = pa.table(batch.to_arrow(index=False, geometry_encoding="WKB"))
+                    yield from table.to_batches()
+                    pbar.update(1)
+
+            first = pa.table(gdf.iloc[:0].to_arrow(index=False, geometry_encoding="WKB"))
+            reader = pa.RecordBatchReader.from_batches(first.schema, batches())
+            pyogrio.write_arrow(
+                reader, output_path, driver=driver,
+                geometry_name=gdf.geometry.name, geometry_type=geometry_type,
+                crs=gdf.crs.to_wkt() if gdf.crs else None
+            )
+        except (ImportError, AttributeError, NotImplementedError, RuntimeError) as e:
+            print(f"\nArrow writer unavailable ({str(e)}), appending batches instead")
+            if os.path.exists(output_path):
+                os.remove(output_path)
+            pbar.reset()
+            for n, start in enumerate(starts):
+                _promote_to_multi(gdf.iloc[start:start + batch_size], geometry_type).to_file(
+                    output_path, driver=driver, mode="a" if n else "w"
+                )
+                pbar.update(1)
+
 def process_tiled_rasters_parallel(
     input_dir,
     output_path,
     num_processes=None,
     batch_size=50,
     tolerance=1.0,
-    chunk_size=1000
+    chunk_size=1000,
+    merge_mode="full",
+    explode=False,
+    spool_dir=None,
+    checkpoint_dir=None,
+    report_path=None
 ):
     """
     Main function to process tiled rasters in parallel and merge them into a single vector file.
     
     Args:
-        input_dir: Path to tiled rasters directory
+        input_dir: Path to tiled rasters directory (*.tif or *.vrt tiles), or a tile index
+                   (.gpkg/.fgb) written by raster_tile
         output_path: Path to save the merged vector output
         num_processes: Number of parallel processes (default: None meaning 10)
-        batch_size: Number of tiles to process in each batch (default: 50)
+        batch_size: Maximum number of tiles in flight in the worker pool (default: 50)
         tolerance: Tolerance for merging geometries (default: 1.0)
-        chunk_size: Size of chunks (number of patches) for merging (default: 1000)
+        chunk_size: Number of patches per spatial bucket of the first merge level (default: 1000)
+        merge_mode: "full" dissolves every patch (default); "seam" keeps patches inside tiles
+                    as they are and dissolves only those on tile seams (see merge_seams);
+                    "value" dissolves touching patches of the same raster value only (see merge_by_value)
+        explode: In "value" mode, one row per polygon instead of one multipolygon per value (default: False)
+        spool_dir: Directory for the temporary on-disk polygon spool (default: next to output_path)
+        checkpoint_dir: Directory keeping tile polygons, merge levels and a manifest.json across
+                        runs (default: None, nothing is kept). A rerun with the same directory
+                        skips unchanged tiles and resumes the merge where it stopped. Tiles that fail
+                        are listed in the manifest and retried by the next run, which stops before merging.
+        report_path: JSON run report with stage, per-tile, per-worker and per-level merge timings
+                     (default: <output_path without extension>_report.json)
 
     Returns:
         Merged vector file (gpkg, geojson, shp and fgb) saved at output_path.
     """
     timer = TicToc()
     timer.tic()
+    timer.params = {'input_dir': input_dir, 'output_path': output_path, 'num_processes': num_processes,
+                    'batch_size': batch_size, 'tolerance': tolerance, 'chunk_size': chunk_size,
+                    'merge_mode': merge_mode, 'explode': explode}
     
     # Input validation
-    all_tiffs = glob.glob(os.path.join(input_dir, "*.tif"))
+    # Tile index from raster_tile (empty tiles already left out), or a directory of GeoTIFF/VRT tiles
+    if os.path.splitext(input_dir)[1].lower() in (".gpkg", ".fgb"):
+        all_tiffs = sorted(gpd.read_file(input_dir, columns=['path'], ignore_geometry=True)['path'])
+    else:
+        all_tiffs = sorted(glob.glob(os.path.join(input_dir, "*.tif")) + glob.glob(os.path.join(input_dir, "*.vrt")))
     if not all_tiffs:
-        raise ValueError(f"No TIFF files found in: {input_dir}")
+        raise ValueError(f"No TIFF or VRT files found in: {input_dir}")
     
     # Output format validation
     try:
@@ -187,47 +772,101 @@ def process_tiled_rasters_parallel(
     except ValueError as e:
         raise ValueError(f"Invalid output path: {str(e)}")
     
+    if merge_mode not in ("full", "seam", "value"):
+        raise ValueError(f"Unsupported merge mode '{merge_mode}'. Supported: full, seam, value")
+    
     # Parallel processing setup
     num_processes = min(
         num_processes or multiprocessing.cpu_count(),
         10  # Cap at 10 cores
     )
 
+    timer.params.update(num_processes=num_processes, tiles=len(all_tiffs))
     print(f"\nProcessing {len(all_tiffs)} tiles ({num_processes} workers)")
 
-    # Process in batches
-    results = []
-    with tqdm(total=len(all_tiffs), desc="Overall progress") as main_pbar:
-        for i in range(0, len(all_tiffs), batch_size):
-            batch = all_tiffs[i:i + batch_size]
-            with multiprocessing.Pool(num_processes) as pool:
-                batch_results = list(tqdm(
-                    pool.imap_unordered(process_tile, batch),
-                    total=len(batch),
-                    desc=f"Batch {i//batch_size + 1}",
-                    leave=False
-                ))
-                results.extend(batch_results)
-                main_pbar.update(len(batch))
-    
-    timer.print_lap("Tile processing completed")
-
-    # Filter and merge
-    valid_results = [gdf for gdf in results if gdf is not None]
-    if not valid_results:
-        raise ValueError("No valid polygons generated")
-    
-    merged_gdf = merge_in_chunks(valid_results, tolerance, chunk_size)
-    merged_gdf['AREA'] = merged_gdf.geometry.area.round(2)
-    timer.print_lap("Spatial merging completed")
-
-    # Save output
-    os.makedirs(os.path.dirname(output_path), exist_ok=True)
-    with tqdm(desc="Saving output", total=1) as pbar:
-        merged_gdf.to_file(output_path, driver=driver)
-        pbar.update(1)
+    # Tiles already polygonized by an earlier run (same file, same settings) are skipped
+    keys = {path: tile_key(path) for path in all_tiffs}
+    if checkpoint_dir:
+        spool = PolygonSpool(directory=os.path.join(checkpoint_dir, "tiles"))
+        todo = [path for path in all_tiffs if not spool.has(keys[path])]
+        mkey = merge_key(keys.values(), tolerance=tolerance, chunk_size=chunk_size, merge_mode=merge_mode)
+        checkpoint = os.path.join(checkpoint_dir, f"merge_{mkey[:16]}")
+        write_manifest(checkpoint_dir, input_dir=os.path.abspath(input_dir), output_path=os.path.abspath(output_path),
+                       tolerance=tolerance, chunk_size=chunk_size, merge_mode=merge_mode, tiles=keys,
+                       merge_key=mkey, polygonize="running", merge="pending", write="pending")
+        if len(todo) < len(all_tiffs):
+            print(f"Resuming: {len(all_tiffs) - len(todo)} tiles already polygonized")
+    else:
+        spool = PolygonSpool(spool_dir or os.path.dirname(os.path.abspath(output_path)))
+        todo = all_tiffs
+        checkpoint = None
+
+    # One long-lived pool; at most batch_size tiles in flight, results go straight to the spool
+    try:
+        failed = []
+        in_flight = threading.BoundedSemaphore(batch_size)
+        stop = threading.Event()
+        with multiprocessing.Pool(num_processes) as pool, \
+                tqdm(total=len(all_tiffs), initial=len(all_tiffs) - len(todo), desc="Overall progress") as main_pbar:
+            try:
+                for path, gdf, stats in pool.imap_unordered(_process_tile_keyed, throttle(todo, in_flight, stop)):
+                    # A failed tile gets no part and no empty marker, so a resumed run retries it
+                    if 'error' in stats:
+                        failed.append(path)
+                    else:
+                        spool.add(gdf, keys[path] if checkpoint_dir else None)
+                    timer.add_tile(stats)
+                    in_flight.release()
+                    main_pbar.update(1)
+            finally:
+                stop.set()
+        
+        if failed:
+            names = sorted(os.path.basename(path) for path in failed)
+            if checkpoint_dir:
+                # The merge checkpoint is keyed by the full tile set; merging without these tiles would cache
+                # an incomplete result under it
+                write_manifest(checkpoint_dir, polygonize="failed", failed_tiles=names)
+                raise RuntimeError(f"{len(failed)} tiles failed ({', '.join(names[:5])}); "
+                                   f"rerun with the same checkpoint_dir to retry them")
+            print(f"\nWarning: {len(failed)} tiles failed and are missing from the output: {', '.join(names[:5])}")
+        if checkpoint_dir:
+            spool.select(keys[path] for path in all_tiffs)
+            write_manifest(checkpoint_dir, polygonize="done", failed_tiles=[], merge="running")
+        timer.print_lap("Tile processing completed")
+
+        # Filter and merge
+        if not len(spool):
+            raise ValueError("No valid polygons generated")
+        valid_results = spool
+        
+        if merge_mode == "seam":
+            footprints = [tile_footprint(path) for path in all_tiffs]
+            merged_gdf = merge_seams(valid_results, footprints, tolerance, chunk_size, num_processes, checkpoint,
+                                     timer)
+        elif merge_mode == "value":
+            merged_gdf = merge_by_value(valid_results, tolerance, chunk_size, num_processes, explode=explode, timer=timer)
+        else:
+            merged_gdf = merge_in_chunks(valid_results, tolerance, chunk_size, num_processes, checkpoint=checkpoint,
+                                         timer=timer)
+        if 'AREA' not in merged_gdf:
+            merged_gdf['AREA'] = merged_gdf.geometry.area.round(2)
+        if checkpoint_dir:
+            write_manifest(checkpoint_dir, merge="done", write="running")
+        timer.print_lap("Spatial merging completed")
+
+        # Save output
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        write_vector_stream(merged_gdf, output_path, driver)
+        if checkpoint_dir:
+            write_manifest(checkpoint_dir, write="done")
+        timer.print_lap("Writing output completed")
+    finally:
+        spool.cleanup()
     
     print(timer.get_summary())
+    report_path = report_path or os.path.splitext(output_path)[0] + "_report.json"
+    print(f"Run report: {timer.save_report(report_path)}")
     print(f"\nSuccessfully saved {len(merged_gdf)} features to {output_path}")
 
 if __name__ == "__main__":
@@ -4,9 +4,14 @@ import rasterio
 from rasterio.windows import Window
 from pathlib import Path
 from tqdm import tqdm
-import tempfile
-import shutil
+from concurrent.futures import ThreadPoolExecutor
+import threading
 import sys
+import xml.etree.ElementTree as ET
+from rasterio.dtypes import dtype_rev, typename_fwd
+from rasterio.enums import MaskFlags
+import geopandas as gpd
+from shapely.geometry import box
 
 def validate_and_prepare_paths(input_path: str, output_dir: str) -> tuple:
     """Validate input path and prepare output directory structure."""
@@ -37,11 +42,138 @@ def save_tile_as_geotiff(data, output_path, template_meta, x, y, width, height,
     with rasterio.open(output_path, 'w', **profile) as dst:
         dst.write(data, 1)
 
+def overlap_tile_grid(width: int, height: int, tile_size: int, overlap: int) -> list:
+    """Row-major list of (row_off, col_off, width, height) tile windows with overlap."""
+    tile_grid = []
+    for y in range(0, height, tile_size - overlap):
+        for x in range(0, width, tile_size - overlap):
+            # Adjust for edges
+            x_off = max(0, x - overlap if x > 0 else 0)
+            y_off = max(0, y - overlap if y > 0 else 0)
+            
+            tile_width = min(tile_size + (overlap if x > 0 else 0), 
+                             width - x_off)
+            tile_height = min(tile_size + (overlap if y > 0 else 0), 
+                              height - y_off)
+            
+            tile_grid.append((y_off, x_off, tile_width, tile_height))
+    return tile_grid
+
+def write_tile(src, tiles_dir, profile, tile, mode="tif", skip_empty=True):
+    """
+    Writes one (row_off, col_off, width, height) tile window of `src` as a GeoTIFF or a VRT.
+
+    Valid pixels are counted from the tile data itself (nodata compare, NaN-aware) when the
+    band mask is a plain nodata mask and the data is read anyway, otherwise from read_masks
+    (per-dataset or alpha masks, and VRT mode, which never reads the data). With `skip_empty`
+    a tile without any valid pixel is not written. Returns the tile's index record (see
+    write_tile_index), or None if skipped.
+    """
+    y, x, width, height = tile
+    win = Window(col_off=x, row_off=y, width=width, height=height)
+    flags = src.mask_flag_enums[0]
+    data = None
+    if mode == "vrt" or MaskFlags.per_dataset in flags or MaskFlags.alpha in flags:
+        valid_pixels = int(np.count_nonzero(src.read_masks(1, window=win)))
+    else:
+        data = src.read(1, window=win)
+        if MaskFlags.nodata not in flags:
+            valid_pixels = data.size
+        elif np.isnan(src.nodata):
+            valid_pixels = int(np.count_nonzero(~np.isnan(data)))
+        else:
+            valid_pixels = int(np.count_nonzero(data != src.nodata))
+    if skip_empty and valid_pixels == 0:
+        return None
+    
+    tile_path = tiles_dir / f"tile_{y:04d}_{x:04d}.{mode}"
+    tile_transform = rasterio.windows.transform(win, src.transform)
+    if mode == "vrt":
+        save_tile_as_vrt(src, tile_path, x, y, width, height, tile_transform)
+    else:
+        save_tile_as_geotiff(
+            data if data is not None else src.read(1, window=win),
+            tile_path,
+            profile,
+            x, y,
+            width, height,
+            tile_transform
+        )
+    return {
+        'path': str(tile_path),
+        'row_off': y, 'col_off': x, 'width': width, 'height': height,
+        'valid_pixels': valid_pixels,
+        'geometry': box(*rasterio.windows.bounds(win, src.transform)),
+    }
+
+def write_tile_index(records, index_path, crs):
+    """Writes the tile index (footprint, pixel window, valid-pixel count, path) as GPKG or FGB."""
+    index_path = Path(index_path)
+    driver = {'.gpkg': 'GPKG', '.fgb': 'FlatGeobuf'}.get(index_path.suffix.lower())
+    if driver is None:
+        raise ValueError(f"Unsupported tile index extension '{index_path.suffix}'. Supported: .gpkg, .fgb")
+    index = gpd.GeoDataFrame(records, geometry='geometry', crs=crs) if records else \
+        gpd.GeoDataFrame(columns=['path', 'row_off', 'col_off', 'width', 'height', 'valid_pixels', 'geometry'],
+                         geometry='geometry', crs=crs)
+    if index_path.exists():
+        index_path.unlink()
+    index.to_file(index_path, driver=driver)
+    return index_path
+
+def select_tiles(index_path, area=None):
+    """
+    Tile paths from a tile index, optionally only tiles intersecting `area`.
+
+    Args:
+        index_path: Tile index written by tile_raster_with_overlap (.gpkg or .fgb)
+        area: Optional (minx, miny, maxx, maxy) tuple or shapely geometry in the index CRS
+
+    Returns:
+        List of tile paths in index (row-major) order.
+    """
+    bbox = area if area is None or isinstance(area, tuple) else area.bounds
+    index = gpd.read_file(index_path, bbox=bbox)
+    if area is not None and not isinstance(area, tuple):
+        index = index[index.intersects(area)]
+    return index.sort_values(['row_off', 'col_off'])['path'].tolist()
+
+def save_tile_as_vrt(src, output_path, x, y, width, height, transform):
+    """
+    Save a tile as a VRT file: a window (SrcRect) into the source raster, no pixels copied.
+
+    The source is referenced relative to the VRT when possible, so tiles and source can be
+    moved together.
+    """
+    output_path = Path(output_path)
+    source = Path(src.name).absolute()
+    try:
+        source_ref, relative = os.path.relpath(source, output_path.parent), "1"
+    except ValueError:  # Different drive (Windows)
+        source_ref, relative = str(source), "0"
+
+    root = ET.Element("VRTDataset", rasterXSize=str(width), rasterYSize=str(height))
+    if src.crs:
+        ET.SubElement(root, "SRS").text = src.crs.to_wkt()
+    ET.SubElement(root, "GeoTransform").text = ", ".join(repr(v) for v in transform.to_gdal())
+    band = ET.SubElement(root, "VRTRasterBand", dataType=typename_fwd[dtype_rev[src.dtypes[0]]], band="1")
+    if src.nodata is not None:
+        ET.SubElement(band, "NoDataValue").text = repr(src.nodata)
+    source_el = ET.SubElement(band, "SimpleSource")
+    ET.SubElement(source_el, "SourceFilename", relativeToVRT=relative).text = source_ref
+    ET.SubElement(source_el, "SourceBand").text = "1"
+    ET.SubElement(source_el, "SrcRect", xOff=str(x), yOff=str(y), xSize=str(width), ySize=str(height))
+    ET.SubElement(source_el, "DstRect", xOff="0", yOff="0", xSize=str(width), ySize=str(height))
+    ET.ElementTree(root).write(output_path)
+
 def tile_raster_with_overlap(
     input_path: str,
     output_dir: str = "output",
     tile_size: int = 1000,
-    overlap: int = 100
+    overlap: int = 100,
+    workers: int = 1,
+    mode: str = "tif",
+    skip_empty: bool = True,
+    index_path: str = None
 ):
     """
     Tile a raster file into smaller chunks with overlap and save them.
@@ -51,17 +183,25 @@ def tile_raster_with_overlap(
         output_dir: Directory to save output tiles
         tile_size: Size of each tile (square)
         overlap: Number of pixels to overlap between tiles
+        workers: Number of threads reading and writing tiles (default 1)
+        mode: "tif" copies every tile into an LZW GeoTIFF (default); "vrt" writes tiny VRT
+              files pointing into the source instead (same grid and names, no pixels copied)
+        skip_empty: Skip tiles without any valid pixel in the dataset mask (default True)
+        index_path: Tile index (.gpkg or .fgb) with footprint, pixel window, valid-pixel count
+                    and path of every written tile (default: output_dir/tile_index.gpkg)
 
     Returns:
-        Tiles (tif) saved in the specified output directory with overlap.
+        Tiles (tif or vrt) saved in the specified output directory with overlap, plus the tile index.
     """
+    if mode not in ("tif", "vrt"):
+        raise ValueError(f"Unsupported tiling mode '{mode}'. Supported: tif, vrt")
+    local = threading.local()
+    handles = []
     try:
         # Validate and prepare paths
         input_path, output_dir, tiles_dir = validate_and_prepare_paths(
             input_path, output_dir
         )
-        
-        temp_dir = Path(tempfile.mkdtemp())
 
         with rasterio.open(str(input_path)) as src:
             # Configure output profile
@@ -74,63 +214,38 @@ def tile_raster_with_overlap(
             )
 
             # Calculate tile grid with overlap
-            tile_grid = []
-            for y in range(0, src.height, tile_size - overlap):
-                for x in range(0, src.width, tile_size - overlap):
-                    # Adjust for edges
-                    x_off = max(0, x - overlap if x > 0 else 0)
-                    y_off = max(0, y - overlap if y > 0 else 0)
-                    
-                    width = min(tile_size + (overlap if x > 0 else 0), 
-                               src.width - x_off)
-                    height = min(tile_size + (overlap if y > 0 else 0), 
-                                src.height - y_off)
-                    
-                    tile_grid.append((y_off, x_off, width, height))
-
-            # Process and save tiles
-            with tqdm(total=len(tile_grid), desc="Creating overlapping tiles") as pbar:
-                for y, x, width, height in tile_grid:
-                    # Create window for current tile with overlap
-                    win = Window(
-                        col_off=x,
-                        row_off=y,
-                        width=width,
-                        height=height
-                    )
-                    
-                    # Read tile data
-                    tile = src.read(1, window=win)
-                    
-                    # Save temporary file
-                    temp_path = temp_dir / f"tile_{y}_{x}.npy"
-                    np.save(temp_path, tile)
-                    
-                    # Save permanent tile
-                    tile_path = tiles_dir / f"tile_{y:04d}_{x:04d}.tif"
-                    tile_transform = rasterio.windows.transform(win, src.transform)
-                    
-                    save_tile_as_geotiff(
-                        tile,
-                        tile_path,
-                        profile,
-                        x, y, 
-                        width, height,
-                        tile_transform
-                    )
-                    
-                    pbar.update(1)
+            tile_grid = overlap_tile_grid(src.width, src.height, tile_size, overlap)
+
+        # One dataset handle per thread (rasterio handles are not thread-safe); GDAL releases
+        # the GIL while reading and LZW-compressing, so the threads overlap the tile I/O
+        def task(tile):
+            if not hasattr(local, "src"):
+                local.src = rasterio.open(str(input_path))
+                handles.append(local.src)
+            return write_tile(local.src, tiles_dir, profile, tile, mode, skip_empty)
+
+        # Process and save tiles (names depend on the window only, so the output is deterministic)
+        records = []
+        with tqdm(total=len(tile_grid), desc="Creating overlapping tiles") as pbar, \
+                ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            for record in executor.map(task, tile_grid):
+                if record is not None:
+                    records.append(record)
+                pbar.update(1)
+
+        index_path = write_tile_index(records, index_path or output_dir / "tile_index.gpkg", profile['crs'])
 
         print(f"\nSuccess! Overlapping tiles saved to: {tiles_dir}")
-        print(f"Total tiles created: {len(tile_grid)}")
+        print(f"Total tiles created: {len(records)} ({len(tile_grid) - len(records)} empty tiles skipped)")
+        print(f"Tile index: {index_path}")
         print(f"Tile size: {tile_size}px with {overlap}px overlap")
 
     except Exception as e:
         print(f"\nError during processing: {str(e)}", file=sys.stderr)
         sys.exit(1)
     finally:
-        if 'temp_dir' in locals():
-            shutil.rmtree(temp_dir, ignore_errors=True)
+        for handle in handles:
+            handle.close()
 
 # Example usage:
 if __name__ == "__main__":
@@ -138,5 +253,6 @@ if __name__ == "__main__":
         input_path = ".../03 Planning/1232-T2-TM2_1-GIS-Remote-Sensing/06_GIS-Data/12_Digitized_Geotechnical/GTM/DEM_Wadis_cm1.tif",
         output_dir = ".../03 Planning/1232-T2-TM2_1-GIS-Remote-Sensing/06_GIS-Data/12_Digitized_Geotechnical/GTM",     
         tile_size = 2000,
-        overlap = 20
+        overlap = 20,
+        workers = 4
     )
@@ -0,0 +1,311 @@
+import os
+import json
+import math
+import hashlib
+import multiprocessing
+import numpy as np
+import rasterio
+from rasterio.enums import Resampling
+from rasterio.vrt import WarpedVRT
+from rasterio.warp import transform_bounds
+from rasterio.transform import from_bounds
+from rasterio.windows import Window
+from pathlib import Path
+from PIL import Image
+from tqdm import tqdm
+
+WEB_MERCATOR = "EPSG:3857"
+ORIGIN_SHIFT = 20037508.342789244  # Half the Web Mercator world width (m)
+TILE_SIZE = 256
+DIGEST_BLOCK = 1024  # Source block (px) whose checksum decides which tiles are re-rendered
+
+# Colour ramps: value range and evenly spaced colour stops (hex)
+COLOR_RAMPS = {
+    # Vegetation cover (%), as produced by the GEE NDVI->VC scripts
+    'vc': (0.0, 100.0, ["#f7f4e9", "#d9ef8b", "#a6d96a", "#66bd63", "#1a9850", "#006837"]),
+    'ndvi': (-0.2, 0.9, ["#8c510a", "#d8b365", "#f6e8c3", "#d9ef8b", "#66bd63", "#1a9850", "#004529"]),
+    # Slope (degrees)
+    'slope': (0.0, 45.0, ["#1a9641", "#a6d96a", "#ffffbf", "#fdae61", "#d7191c", "#7b0000"]),
+    'gray': (None, None, ["#000000", "#ffffff"]),
+}
+
+def color_lut(ramp, steps=256):
+    """(steps, 3) uint8 lookup table interpolated between the colour stops of `ramp`."""
+    stops = np.array([[int(c[i:i + 2], 16) for i in (1, 3, 5)] for c in ramp], dtype=float)
+    positions = np.linspace(0, 1, len(stops))
+    grid = np.linspace(0, 1, steps)
+    return np.column_stack([np.interp(grid, positions, stops[:, i]) for i in range(3)]).round().astype(np.uint8)
+
+def colorize(data, valid, vmin, vmax, lut):
+    """RGBA uint8 image of `data` through `lut` over [vmin, vmax]; invalid pixels are transparent."""
+    scaled = (data.astype(np.float32) - vmin) / ((vmax - vmin) or 1.0)
+    idx = np.clip(np.nan_to_num(scaled * (len(lut) - 1)), 0, len(lut) - 1).astype(np.intp)
+    rgba = np.empty(data.shape + (4,), dtype=np.uint8)
+    rgba[..., :3] = lut[idx]
+    rgba[..., 3] = np.where(valid, 255, 0)
+    return rgba
+
+def tile_bounds(x, y, z):
+    """Web Mercator bounds (minx, miny, maxx, maxy) of XYZ tile x/y at zoom z."""
+    size = 2 * ORIGIN_SHIFT / 2 ** z
+    return (-ORIGIN_SHIFT + x * size, ORIGIN_SHIFT - (y + 1) * size,
+            -ORIGIN_SHIFT + (x + 1) * size, ORIGIN_SHIFT - y * size)
+
+def tiles_for_bounds(bounds, z):
+    """XYZ tiles (x, y) at zoom z covering Web Mercator `bounds`."""
+    n = 2 ** z
+    size = 2 * ORIGIN_SHIFT / n
+    minx, miny, maxx, maxy = bounds
+    x0 = max(0, int(math.floor((minx + ORIGIN_SHIFT) / size)))
+    x1 = min(n - 1, int(math.ceil((maxx + ORIGIN_SHIFT) / size)) - 1)
+    y0 = max(0, int(math.floor((ORIGIN_SHIFT - maxy) / size)))
+    y1 = min(n - 1, int(math.ceil((ORIGIN_SHIFT - miny) / size)) - 1)
+    return [(x, y) for x in range(x0, x1 + 1) for y in range(y0, y1 + 1)]
+
+def zoom_range(bounds, resolution):
+    """
+    Default zoom levels for a raster: from the level where it fits in one tile up to the first
+    level whose pixels are at least as fine as `resolution` (Web Mercator metres).
+    """
+    world = 2 * ORIGIN_SHIFT
+    extent = max(bounds[2] - bounds[0], bounds[3] - bounds[1])
+    max_zoom = max(0, min(24, math.ceil(math.log2(world / (TILE_SIZE * resolution)))))
+    min_zoom = max(0, min(max_zoom, math.floor(math.log2(world / extent))))
+    return min_zoom, max_zoom
+
+def block_digests(src, band=1, block=DIGEST_BLOCK):
+    """sha1 of every `block` x `block` source window (key "row_col"), to detect changed areas."""
+    digests = {}
+    for row in range(0, src.height, block):
+        for col in range(0, src.width, block):
+            win = Window(col, row, min(block, src.width - col), min(block, src.height - row))
+            digests[f"{row}_{col}"] = hashlib.sha1(src.read(band, window=win).tobytes()).hexdigest()
+    return digests
+
+def changed_areas(src, old_digests, new_digests, block=DIGEST_BLOCK):
+    """Web Mercator bounds of the source blocks whose digest differs from the previous run."""
+    areas = []
+    for key, digest in new_digests.items():
+        if old_digests.get(key) == digest:
+            continue
+        row, col = map(int, key.split("_"))
+        win = Window(col, row, min(block, src.width - col), min(block, src.height - row))
+        areas.append(transform_bounds(src.crs, WEB_MERCATOR, *rasterio.windows.bounds(win, src.transform)))
+    return areas
+
+_WORKER = {}
+
+def _init_xyz_worker(input_path, band, vmin, vmax, ramp, resampling, tile_format):
+    """Pool initializer: every worker opens the source once."""
+    _WORKER.update(
+        src=rasterio.open(input_path), resampling=Resampling[resampling],
+        band=band, vmin=vmin, vmax=vmax, lut=color_lut(ramp), tile_format=tile_format,
+    )
+
+def tile_path(output_dir, x, y, z, scheme="xyz", tile_format="png"):
+    """File of XYZ tile x/y at zoom z in the pyramid (output_dir/z/x/row.ext, row flipped for "tms")."""
+    row = (2 ** z - 1 - y) if scheme == "tms" else y
+    return str(Path(output_dir) / str(z) / str(x) / f"{row}.{tile_format}")
+
+def merge_children(children, nearest=False):
+    """
+    RGBA tile at half the resolution of its four child tiles (top-left, top-right, bottom-left,
+    bottom-right; None for a missing child). Every output pixel takes the alpha-weighted mean
+    colour of its 2x2 child pixels, or the top-left one with `nearest` (class rasters).
+    """
+    mosaic = np.zeros((2 * TILE_SIZE, 2 * TILE_SIZE, 4), dtype=np.uint8)
+    for i, child in enumerate(children):
+        if child is not None:
+            row, col = divmod(i, 2)
+            mosaic[row * TILE_SIZE:(row + 1) * TILE_SIZE, col * TILE_SIZE:(col + 1) * TILE_SIZE] = child
+    if nearest:
+        return np.ascontiguousarray(mosaic[::2, ::2])
+    blocks = mosaic.reshape(TILE_SIZE, 2, TILE_SIZE, 2, 4).astype(np.float32)
+    alpha = blocks[..., 3]
+    weight = alpha.sum(axis=(1, 3))
+    rgba = np.empty((TILE_SIZE, TILE_SIZE, 4), dtype=np.uint8)
+    rgba[..., :3] = ((blocks[..., :3] * alpha[..., None]).sum(axis=(1, 3))
+                     / np.maximum(weight, 1)[..., None]).round()
+    rgba[..., 3] = np.where(weight > 0, 255, 0)
+    return rgba
+
+def _render_tile(task):
+    """
+    Pool task: renders one tile to `path`; returns False if the tile holds no valid pixel.
+
+    Tiles of the highest zoom (`children` None) are warped from the source, every lower tile
+    is merged from its four already rendered children, so the source is read only once.
+    """
+    x, y, z, path, children = task
+    if children is None:
+        # Warp the source straight onto the tile grid. The alpha band marks pixels outside the
+        # source footprint and source nodata, also for sources without a nodata value
+        transform = from_bounds(*tile_bounds(x, y, z), TILE_SIZE, TILE_SIZE)
+        with WarpedVRT(_WORKER['src'], crs=WEB_MERCATOR, transform=transform, width=TILE_SIZE, height=TILE_SIZE,
+                       resampling=_WORKER['resampling'], add_alpha=True) as vrt:
+            data = vrt.read(_WORKER['band'])
+            valid = vrt.read(vrt.count) > 0  # The added alpha band comes last
+        rgba = colorize(data, valid, _WORKER['vmin'], _WORKER['vmax'], _WORKER['lut']) if valid.any() else None
+    else:
+        images = [np.asarray(Image.open(child).convert("RGBA")) if os.path.exists(child) else None
+                  for child in children]
+        rgba = None
+        if any(image is not None for image in images):
+            rgba = merge_children(images, nearest=_WORKER['resampling'] == Resampling.nearest)
+            if not rgba[..., 3].any():
+                rgba = None
+    if rgba is None:
+        if os.path.exists(path):
+            os.remove(path)  # Area became empty since the previous run
+        return False
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    image = Image.fromarray(rgba, mode="RGBA")
+    if _WORKER['tile_format'] == "webp":
+        image.save(path, format="WEBP", lossless=True)
+    else:
+        image.save(path, format="PNG", optimize=True)
+    return True
+
+def build_xyz_pyramid(
+    input_path: str,
+    output_dir: str,
+    ramp: str = "vc",
+    min_zoom: int = None,
+    max_zoom: int = None,
+    vmin: float = None,
+    vmax: float = None,
+    band: int = 1,
+    tile_format: str = "png",
+    scheme: str = "xyz",
+    resampling: str = "bilinear",
+    num_processes: int = None,
+    force: bool = False
+):
+    """
+    Cuts a GeoTIFF into a Web Mercator tile pyramid (output_dir/z/x/y.png) for the WGIS viewer.
+
+    Tiles of the highest zoom are warped from the source and rendered through a colour ramp in a
+    process pool; each lower zoom is then merged from the tiles of the zoom above (see
+    merge_children), so sources without overviews are not re-read per level. A manifest (xyz_manifest.json)
+    keeps the render settings and a checksum per source block; on re-runs only missing tiles and
+    tiles over changed source blocks are rendered, everything else is left as it is.
+
+    Args:
+        input_path: Path to input raster (any CRS)
+        output_dir: Directory of the tile pyramid
+        ramp: Colour ramp name from COLOR_RAMPS ("vc", "ndvi", "slope", "gray") or a list of hex colours
+        min_zoom: Lowest zoom level (default: level where the raster fits in one tile)
+        max_zoom: Highest zoom level (default: first level at least as fine as the raster)
+        vmin: Value mapped to the first colour (default: ramp range, else band minimum)
+        vmax: Value mapped to the last colour (default: ramp range, else band maximum)
+        band: Band to render (default 1)
+        tile_format: "png" (default) or "webp"
+        scheme: "xyz" (default, y from the top as in Leaflet/ArcGIS WebTileLayer) or "tms" (y from the bottom)
+        resampling: Resampling when warping to Web Mercator (default "bilinear"; "nearest" for classes)
+        num_processes: Number of render processes (default None meaning all cores)
+        force: Re-render every tile, ignoring the manifest
+
+    Returns:
+        Dict with the zoom range, number of rendered, skipped and empty tiles.
+    """
+    if tile_format not in ("png", "webp"):
+        raise ValueError(f"Unsupported tile format '{tile_format}'. Supported: png, webp")
+    if scheme not in ("xyz", "tms"):
+        raise ValueError(f"Unsupported tile scheme '{scheme}'. Supported: xyz, tms")
+    if isinstance(ramp, str):
+        if ramp not in COLOR_RAMPS:
+            raise ValueError(f"Unknown colour ramp '{ramp}'. Available: {', '.join(COLOR_RAMPS)}")
+        ramp_vmin, ramp_vmax, colors = COLOR_RAMPS[ramp]
+    else:
+        ramp_vmin, ramp_vmax, colors = None, None, list(ramp)
+
+    input_path = str(Path(input_path).absolute())
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    with rasterio.open(input_path) as src:
+        if src.crs is None:
+            raise ValueError(f"Input raster has no CRS: {input_path}")
+        if vmin is None or vmax is None:
+            if ramp_vmin is None:
+                stats = src.stats(indexes=band, approx=True)[0]
+                ramp_vmin, ramp_vmax = stats.min, stats.max
+            vmin = ramp_vmin if vmin is None else vmin
+            vmax = ramp_vmax if vmax is None else vmax
+
+        with WarpedVRT(src, crs=WEB_MERCATOR) as vrt:
+            bounds, resolution = vrt.bounds, vrt.res[0]
+        default_min, default_max = zoom_range(bounds, resolution)
+        min_zoom = default_min if min_zoom is None else min_zoom
+        max_zoom = default_max if max_zoom is None else max_zoom
+
+        # Decide what is stale: everything if the settings changed, else tiles over changed blocks
+        settings = {'band': band, 'colors': colors, 'vmin': vmin, 'vmax': vmax, 'tile_format': tile_format,
+                    'scheme': scheme, 'resampling': resampling, 'digest_block': DIGEST_BLOCK, 'levels': "children"}
+        manifest_path = output_dir / "xyz_manifest.json"
+        manifest = {}
+        if manifest_path.exists() and not force:
+            with open(manifest_path) as f:
+                manifest = json.load(f)
+        digests = block_digests(src, band)
+        if manifest.get('settings') == settings:
+            stale = changed_areas(src, manifest.get('digests', {}), digests)
+        else:
+            stale = [bounds]
+
+    # Tiles found empty by the previous run (same settings) count as up to date as well
+    known_empty = set(manifest.get('empty', [])) if manifest.get('settings') == settings else set()
+    # Highest zoom first: every lower tile is merged from its children, so a stale child makes
+    # its parent (which covers the same changed area) stale as well
+    tasks, skipped = [], 0
+    for z in range(max_zoom, min_zoom - 1, -1):
+        stale_tiles = set()
+        for area in stale:
+            stale_tiles.update(tiles_for_bounds(area, z))
+        for x, y in tiles_for_bounds(bounds, z):
+            path = tile_path(output_dir, x, y, z, scheme, tile_format)
+            if (x, y) not in stale_tiles and (os.path.exists(path) or f"{z}/{x}/{y}" in known_empty):
+                skipped += 1
+                continue
+            children = None
+            if z < max_zoom:
+                children = [tile_path(output_dir, 2 * x + dx, 2 * y + dy, z + 1, scheme, tile_format)
+                            for dy in (0, 1) for dx in (0, 1)]
+            tasks.append((x, y, z, path, children))
+
+    print(f"\nZoom {min_zoom}-{max_zoom}: {len(tasks)} tiles to render, {skipped} up to date")
+
+    # Render in a process pool; tiles without valid pixels are not written, only remembered
+    num_processes = num_processes or multiprocessing.cpu_count()
+    empty = known_empty - {f"{z}/{x}/{y}" for x, y, z, _, _ in tasks}
+    rendered = 0
+    if tasks:
+        initargs = (input_path, band, vmin, vmax, colors, resampling, tile_format)
+        with multiprocessing.Pool(num_processes, initializer=_init_xyz_worker, initargs=initargs) as pool, \
+                tqdm(total=len(tasks), desc="Rendering tiles") as pbar:
+            # One level at a time, as a level needs the finished tiles of the level above
+            for z in range(max_zoom, min_zoom - 1, -1):
+                level = [task for task in tasks if task[2] == z]
+                for (x, y, _, _, _), written in zip(level, pool.imap(_render_tile, level, chunksize=16)):
+                    if written:
+                        rendered += 1
+                    else:
+                        empty.add(f"{z}/{x}/{y}")
+                    pbar.update(1)
+
+    with open(manifest_path, "w") as f:
+        json.dump({'source': input_path, 'settings': settings, 'min_zoom': min_zoom, 'max_zoom': max_zoom,
+                   'digests': digests, 'empty': sorted(empty)}, f)
+
+    print(f"Rendered {rendered} tiles ({len(empty)} empty tiles not written) to: {output_dir}")
+    return {'min_zoom': min_zoom, 'max_zoom': max_zoom, 'rendered': rendered, 'skipped': skipped, 'empty': len(empty)}
+
+# Example usage:
+if __name__ == "__main__":
+    build_xyz_pyramid(
+        input_path = ".../03 Planning/1232-T2-TM2_1-GIS-Remote-Sensing/06_GIS-Data/12_Digitized_Geotechnical/GTM/VC_2024.tif",
+        output_dir = ".../WGIS_JavaScript/staticDATA/tiles/VC_2024",   # Served as /staticDATA/tiles/VC_2024/{z}/{x}/{y}.png
+        ramp = "vc",
+        num_processes = 8
+    )
@@ -1,87 +1,695 @@
+import os
+import warnings
 import rasterio
+import rasterio.shutil
+from affine import Affine
+from rasterio.enums import MaskFlags, Resampling
+from rasterio.windows import Window
 import numpy as np
 from scipy.ndimage import convolve
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+from contextlib import ExitStack
+from functools import partial
+import threading
 import time
 
-def calculate_slope_horn_tiled(input_raster_path, output_raster_path, resolution, tile_size=512):
+HORN_BUFFER = 1  # Horn's 3x3 window needs one pixel of halo on every side
+TERRAIN_PRODUCTS = ('slope', 'aspect', 'hillshade', 'curvature', 'tri', 'tpi')
+SLOPE_QUANTIZATION = ('uint8', 'uint16')
+COG_BLOCKSIZE = 512
+
+def horn_workspace(shape):
+    """Preallocated float32 buffers for horn_slope, reusable across tiles of the same shape."""
+    interior = (shape[0] - 2 * HORN_BUFFER, shape[1] - 2 * HORN_BUFFER)
+    return {
+        'shape': tuple(shape),
+        'dzdy': np.empty(interior, dtype=np.float32),
+        'tmp': np.empty(interior, dtype=np.float32),
+        'out': np.empty(shape, dtype=np.float32)
+    }
+
+def _horn_gradients(z, dzdx, dzdy, tmp):
+    """Unscaled Horn sums (8 * resolution * dz/dx, dz/dy) of the interior of z, written into dzdx/dzdy."""
+    a, b, c = z[:-2, :-2], z[:-2, 1:-1], z[:-2, 2:]
+    d, f = z[1:-1, :-2], z[1:-1, 2:]
+    g, h, i = z[2:, :-2], z[2:, 1:-1], z[2:, 2:]
+
+    # dz/dx: (c + 2f + i) - (a + 2d + g)
+    np.subtract(c, a, out=dzdx)
+    np.add(dzdx, i, out=dzdx)
+    np.subtract(dzdx, g, out=dzdx)
+    np.subtract(f, d, out=tmp)
+    tmp *= 2
+    dzdx += tmp
+
+    # dz/dy: (g + 2h + i) - (a + 2b + c), rows increasing southwards
+    np.subtract(g, a, out=dzdy)
+    np.add(dzdy, i, out=dzdy)
+    np.subtract(dzdy, c, out=dzdy)
+    np.subtract(h, b, out=tmp)
+    tmp *= 2
+    dzdy += tmp
+
+def horn_slope(tile_elevation, resolution, workspace=None):
+    """
+    Slope (degrees) of a buffered float32 tile using Horn's formula on shifted views.
+
+    dz/dx and dz/dy are accumulated in place from the eight neighbour views of the
+    tile, so no kernel, padded copy or squared temporaries are created. Cells on
+    the outer ring of the tile have no full 3x3 neighbourhood and are set to NaN,
+    exactly as the former convolve(..., mode='constant', cval=np.nan) did.
+
+    Args:
+        tile_elevation: 2D float32 array (buffered tile)
+        resolution: Pixel size in map units
+        workspace: Buffers from horn_workspace(tile_elevation.shape) (created if None or mismatched)
+
+    Returns:
+        Slope array in degrees; a view of workspace['out'] (overwritten by the next call).
+    """
+    if workspace is None or workspace['shape'] != tile_elevation.shape:
+        workspace = horn_workspace(tile_elevation.shape)
+    out = workspace['out']
+    out.fill(np.nan)
+    if min(tile_elevation.shape) < 3:
+        return out
+
+    dzdx = out[1:-1, 1:-1]  # Written straight into the output interior
+    _horn_gradients(tile_elevation, dzdx, workspace['dzdy'], workspace['tmp'])
+    dzdy = workspace['dzdy']
+
+    # slope = degrees(arctan(hypot(dzdx, dzdy) / (8 * resolution)))
+    np.hypot(dzdx, dzdy, out=dzdx)
+    dzdx *= np.float32(1.0 / (8 * resolution))
+    np.arctan(dzdx, out=dzdx)
+    np.degrees(dzdx, out=dzdx)
+    return out
+
+def _horn_slope_convolve(tile_elevation, resolution):
+    """Former per-tile implementation (two scipy convolutions), kept as benchmark reference."""
+    dzdx_kernel = np.array([[-1, 0, 1], [-2, 0, 2], [-1, 0, 1]]) / (8 * resolution)
+    dzdy_kernel = np.array([[1, 2, 1], [0, 0, 0], [-1, -2, -1]]) / (8 * resolution)
+    dzdx_tile = convolve(tile_elevation, dzdx_kernel, mode='constant', cval=np.nan)
+    dzdy_tile = convolve(tile_elevation, dzdy_kernel, mode='constant', cval=np.nan)
+    slope_rad_tile = np.arctan(np.sqrt(dzdx_tile**2 + dzdy_tile**2))
+    return np.degrees(slope_rad_tile)
+
+def terrain_workspace(shape, products):
+    """Preallocated float32 buffers for terrain_tile: shared gradients plus one output per product."""
+    workspace = horn_workspace(shape)
+    workspace['products'] = tuple(products)
+    workspace['dzdx'] = np.empty_like(workspace['dzdy'])
+    for name in products:
+        workspace[name] = np.empty(shape, dtype=np.float32)
+    return workspace
+
+def terrain_tile(tile_elevation, resolution, products, workspace=None, azimuth=315.0, altitude=45.0):
+    """
+    Computes several terrain derivatives of a buffered float32 tile from one 3x3 neighbourhood.
+
+    Gradients (Horn) are computed once and shared by slope, aspect and hillshade; curvature,
+    TRI and TPI use the same shifted views. Conventions follow ArcGIS/GDAL:
+        slope: degrees
+        aspect: degrees clockwise from north of the downslope direction, -1 on flat cells
+        hillshade: 0-255 for the given sun azimuth/altitude (degrees)
+        curvature: Zevenbergen & Thorne, -2 * (D + E) * 100 (positive = convex)
+        tri: Riley's terrain ruggedness index, sqrt of the summed squared neighbour differences
+        tpi: centre elevation minus the mean of its eight neighbours
+    The outer ring of the tile is NaN for every product.
+
+    Args:
+        tile_elevation: 2D float32 array (buffered tile)
+        resolution: Pixel size in map units
+        products: Iterable of names from TERRAIN_PRODUCTS
+        workspace: Buffers from terrain_workspace (created if None or mismatched)
+        azimuth: Sun azimuth for hillshade in degrees (default 315)
+        altitude: Sun altitude for hillshade in degrees (default 45)
+
+    Returns:
+        Dict product -> array views of the workspace (overwritten by the next call).
+    """
+    products = tuple(products)
+    if (workspace is None or workspace['shape'] != tile_elevation.shape
+            or workspace.get('products') != products):
+        workspace = terrain_workspace(tile_elevation.shape, products)
+    for name in products:
+        workspace[name].fill(np.nan)
+    result = {name: workspace[name] for name in products}
+    if min(tile_elevation.shape) < 3:
+        return result
+
+    z = tile_elevation
+    e = z[1:-1, 1:-1]
+    dzdx, dzdy, tmp = workspace['dzdx'], workspace['dzdy'], workspace['tmp']
+    scale = np.float32(1.0 / (8 * resolution))
+
+    if {'slope', 'aspect', 'hillshade'} & set(products):
+        _horn_gradients(z, dzdx, dzdy, tmp)
+        dzdx *= scale
+        dzdy *= scale
+        slope_rad = np.arctan(np.hypot(dzdx, dzdy))
+        aspect_rad = np.arctan2(dzdy, -dzdx)
+        aspect_rad[aspect_rad < 0] += np.float32(2 * np.pi)
+        flat = (dzdx == 0) & (dzdy == 0)
+
+        if 'slope' in products:
+            np.degrees(slope_rad, out=result['slope'][1:-1, 1:-1])
+        if 'aspect' in products:
+            # Math angle (counter-clockwise from east) -> compass bearing
+            aspect = result['aspect'][1:-1, 1:-1]
+            np.degrees(aspect_rad, out=aspect)
+            np.subtract(np.float32(450), aspect, out=aspect)
+            np.mod(aspect, np.float32(360), out=aspect)
+            aspect[flat] = -1
+        if 'hillshade' in products:
+            zenith = np.radians(90.0 - altitude)
+            azimuth_math = np.radians((360.0 - azimuth + 90.0) % 360.0)
+            shade = result['hillshade'][1:-1, 1:-1]
+            np.subtract(np.float32(azimuth_math), aspect_rad, out=shade)
+            np.cos(shade, out=shade)
+            shade *= np.sin(slope_rad) * np.float32(np.sin(zenith))
+            shade += np.cos(slope_rad) * np.float32(np.cos(zenith))
+            np.clip(shade * np.float32(255), 0, 255, out=shade)
+
+    if 'curvature' in products:
+        # D = ((d + f) / 2 - e) / L^2, E = ((b + h) / 2 - e) / L^2
+        curvature = result['curvature'][1:-1, 1:-1]
+        np.add(z[1:-1, :-2], z[1:-1, 2:], out=curvature)
+        curvature += z[:-2, 1:-1]
+        curvature += z[2:, 1:-1]
+        curvature -= 4 * e
+        curvature *= np.float32(-100.0 / (resolution * resolution))
+
+    if 'tri' in products or 'tpi' in products:
+        neighbours = [z[:-2, :-2], z[:-2, 1:-1], z[:-2, 2:], z[1:-1, :-2],
+                      z[1:-1, 2:], z[2:, :-2], z[2:, 1:-1], z[2:, 2:]]
+        if 'tri' in products:
+            tri = result['tri'][1:-1, 1:-1]
+            tri.fill(0)
+            for n in neighbours:
+                np.subtract(n, e, out=tmp)
+                tmp *= tmp
+                tri += tmp
+            np.sqrt(tri, out=tri)
+        if 'tpi' in products:
+            tpi = result['tpi'][1:-1, 1:-1]
+            tpi.fill(0)
+            for n in neighbours:
+                tpi += n
+            tpi *= np.float32(-1.0 / 8)
+            tpi += e
+
+    return result
+
+def slope_tile_grid(rows, cols, tile_size, buffer=HORN_BUFFER):
+    """
+    Plans the tiled loop: one (read_window, write_window, crop) entry per tile, in row-major order.
+
+    tile_size is an int (square tiles) or a (rows, cols) tuple. read_window is the tile grown by
+    `buffer` pixels (clipped to the raster), write_window the original tile boundaries and crop
+    the (row, col) slices of the processed tile to write.
+    """
+    if isinstance(tile_size, int):
+        tile_size = (tile_size, tile_size)
+    tile_rows, tile_cols = tile_size
+
+    grid = []
+    for row_start in range(0, rows, tile_rows):
+        row_end = min(row_start + tile_rows, rows)
+        for col_start in range(0, cols, tile_cols):
+            col_end = min(col_start + tile_cols, cols)
+
+            # Read tile with buffer
+            tile_row_start = max(0, row_start - buffer)
+            tile_row_end = min(rows, row_end + buffer)
+            tile_col_start = max(0, col_start - buffer)
+            tile_col_end = min(cols, col_end + buffer)
+
+            read_window = Window(tile_col_start, tile_row_start,
+                                 tile_col_end - tile_col_start,
+                                 tile_row_end - tile_row_start)
+
+            # Define the write window (original tile boundaries)
+            write_window = Window(col_start, row_start,
+                                  col_end - col_start,
+                                  row_end - row_start)
+
+            # Define the slice of the *processed* tile to write
+            crop = (slice(row_start - tile_row_start, row_end - tile_row_start),
+                    slice(col_start - tile_col_start, col_end - tile_col_start))
+
+            grid.append((read_window, write_window, crop))
+    return grid
+
+def plan_tile_grid(src, tile_size=512, buffer=HORN_BUFFER, align_to_blocks=True, even=False):
+    """
+    Plans the tiled loop of an open dataset, lining tiles up with its internal blocks.
+
+    Tile edges are rounded to the nearest multiple of the block (or strip) height and, for
+    internally tiled GeoTIFFs, of the block width, so every compressed block is decoded by
+    one tile only (plus the one-pixel halo reads).
+
+    Args:
+        src: Open rasterio dataset
+        tile_size: Requested tile edge in pixels
+        buffer: Halo in pixels
+        align_to_blocks: Whether to snap the tile shape to src.block_shapes (default True)
+        even: Whether tile edges must be even, so 2x2 overview blocks never straddle tiles
+
+    Returns:
+        List of (read_window, write_window, crop) as slope_tile_grid.
+    """
+    tile_rows = tile_cols = tile_size
+    if align_to_blocks:
+        block_rows, block_cols = src.block_shapes[0]
+        tile_rows = max(1, round(tile_size / block_rows)) * block_rows
+        if block_cols < src.width:  # Internally tiled (strips span the full width)
+            tile_cols = max(1, round(tile_size / block_cols)) * block_cols
+    if even:
+        tile_rows += tile_rows % 2 * (block_rows if align_to_blocks else 1)
+        tile_cols += tile_cols % 2 * (block_cols if align_to_blocks and block_cols < src.width else 1)
+    return slope_tile_grid(src.height, src.width, (tile_rows, tile_cols), buffer)
+
+def _has_nodata_mask(src):
+    """True if band 1 has a nodata value or an internal/external mask band."""
+    flags = src.mask_flag_enums[0]
+    return src.nodata is not None or MaskFlags.per_dataset in flags or MaskFlags.alpha in flags
+
+def _read_elevation(src, tile):
+    """
+    Reads a buffered tile as float32 with nodata (value or mask) set to NaN.
+
+    Returns None when the tile core (write region) holds no valid pixel, so callers can
+    skip the computation and write nodata directly. NaN in the halo propagates to the
+    neighbouring cells, so nodata never leaks in as an elevation.
+    """
+    read_window, _, crop = tile
+    if src.nodata is None and _has_nodata_mask(src):
+        # Mask band is cheaper than the data: check it before decoding the elevation
+        valid = src.read_masks(1, window=read_window) > 0
+        if not valid[crop].any():
+            return None
+        tile_elevation = src.read(1, window=read_window).astype(np.float32, copy=False)
+        tile_elevation[~valid] = np.nan
+        return tile_elevation
+
+    tile_elevation = src.read(1, window=read_window).astype(np.float32, copy=False)
+    if src.nodata is not None:
+        invalid = np.isnan(tile_elevation) if np.isnan(src.nodata) else tile_elevation == np.float32(src.nodata)
+        if invalid[crop].all():
+            return None
+        tile_elevation[invalid] = np.nan
+    return tile_elevation
+
+_NODATA_FILLS = {}
+
+def _nodata_fill(window):
+    """Cached NaN block for the all-nodata fast path (read-only, shared by shape)."""
+    shape = (int(window.height), int(window.width))
+    if shape not in _NODATA_FILLS:
+        _NODATA_FILLS[shape] = np.full(shape, np.nan, dtype=np.float32)
+    return _NODATA_FILLS[shape]
+
+def _output_profile(src, count):
+    """Float32 output profile of the DEM; nodata becomes NaN when the DEM has nodata or a mask."""
+    output_profile = src.profile.copy()
+    output_profile.update(dtype=rasterio.float32, count=count)
+    if _has_nodata_mask(src):
+        output_profile.update(nodata=np.nan)
+    return output_profile
+
+def _slope_tile(src, tile, state, resolution):
+    """Reads one buffered tile and returns its cropped slope (a view of the reused workspace), None if all nodata."""
+    _, _, crop = tile
+    tile_elevation = _read_elevation(src, tile)
+    if tile_elevation is None:
+        return None
+
+    # Apply Horn's formula (buffers are reused while the tile shape is unchanged)
+    workspace = state.get('workspace')
+    if workspace is None or workspace['shape'] != tile_elevation.shape:
+        workspace = state['workspace'] = horn_workspace(tile_elevation.shape)
+    return horn_slope(tile_elevation, resolution, workspace)[crop]
+
+def _terrain_tile(src, tile, state, resolution, products, azimuth, altitude):
+    """Reads one buffered tile and returns the cropped derivatives (views of the reused workspace), None if all nodata."""
+    _, _, crop = tile
+    tile_elevation = _read_elevation(src, tile)
+    if tile_elevation is None:
+        return None
+    workspace = state.get('workspace')
+    if workspace is None or workspace['shape'] != tile_elevation.shape:
+        workspace = state['workspace'] = terrain_workspace(tile_elevation.shape, products)
+    result = terrain_tile(tile_elevation, resolution, products, workspace, azimuth, altitude)
+    return {name: array[crop] for name, array in result.items()}
+
+def _detach(result):
+    """Copies a tile result (array or dict of arrays) out of the reusable workspace."""
+    if result is None:
+        return None
+    if isinstance(result, dict):
+        return {name: np.array(array, copy=True) for name, array in result.items()}
+    return np.array(result, copy=True)
+
+def iter_tile_results(src, input_raster_path, grid, compute, workers=1, max_in_flight=None):
+    """
+    Yields (tile, result) for every tile of `grid` in grid order, computing them with `compute(src, tile, state)`.
+
+    With workers > 1 tiles are read and computed in a thread pool (NumPy and GDAL release the GIL);
+    every thread opens its own dataset handle and keeps its own `state`. Results are yielded in
+    order to the single caller, which stays the only writer. At most `max_in_flight` tiles
+    (default 2 * workers) are pending at once, which bounds memory.
+    """
+    if workers is None or workers <= 1:
+        state = {}
+        for tile in grid:
+            yield tile, compute(src, tile, state)
+        return
+
+    max_in_flight = max(max_in_flight or 2 * workers, 1)
+    local = threading.local()
+    handles = []
+    handles_lock = threading.Lock()
+
+    def task(tile):
+        if not hasattr(local, 'src'):
+            local.src = rasterio.open(input_raster_path)
+            local.state = {}
+            with handles_lock:
+                handles.append(local.src)
+        # Workspace buffers are reused by the next tile of this thread, so detach the result
+        return _detach(compute(local.src, tile, local.state))
+
+    pending = deque()
+    tiles = iter(grid)
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for tile in tiles:
+                pending.append((tile, executor.submit(task, tile)))
+                if len(pending) >= max_in_flight:
+                    break
+            while pending:
+                tile, future = pending.popleft()
+                result = future.result()
+                next_tile = next(tiles, None)
+                if next_tile is not None:
+                    pending.append((next_tile, executor.submit(task, next_tile)))
+                yield tile, result
+    finally:
+        for handle in handles:
+            handle.close()
+
+def encode_slope(slope_deg, quantize=None):
+    """
+    Encodes slope degrees for writing: float32 as is, or quantized to uint8/uint16.
+
+    Quantized values are round(slope / scale) with scale = 90 / (max - 1); the top value
+    of the type is nodata. Returns (array, scale, nodata).
+    """
+    if quantize is None:
+        return slope_deg, 1.0, np.nan
+    if quantize not in SLOPE_QUANTIZATION:
+        raise ValueError(
+            f"Unsupported slope quantization '{quantize}'. "
+            f"Supported: {', '.join(SLOPE_QUANTIZATION)}"
+        )
+    dtype = np.dtype(quantize)
+    nodata = np.iinfo(dtype).max
+    scale = 90.0 / (nodata - 1)
+    with np.errstate(invalid='ignore'):
+        encoded = np.rint(slope_deg / scale)
+    encoded[np.isnan(encoded)] = nodata
+    return encoded.astype(dtype), scale, nodata
+
+def _downsample2(data):
+    """2x2 NaN-aware mean (odd edges average the available pixels)."""
+    rows, cols = data.shape
+    padded = np.full((rows + rows % 2, cols + cols % 2), np.nan, dtype=np.float32)
+    padded[:rows, :cols] = data
+    blocks = padded.reshape(padded.shape[0] // 2, 2, padded.shape[1] // 2, 2)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', category=RuntimeWarning)  # All-NaN blocks stay NaN
+        return np.nanmean(blocks, axis=(1, 3)).astype(np.float32)
+
+def _overview_factors(height, width, blocksize=COG_BLOCKSIZE):
+    """Overview decimation factors (2, 4, ...) until the raster fits in one block."""
+    factors = []
+    factor = 2
+    while max(height, width) / factor > blocksize / 2 or not factors:
+        factors.append(factor)
+        factor *= 2
+    return factors
+
+def _finalize_cog(stream_path, output_raster_path, quantize):
+    """Rewrites the streamed GeoTIFF (+ its streamed .ovr) into a COG, reusing the overviews."""
+    with rasterio.open(stream_path) as stream:
+        height, width = stream.height, stream.width
+    ovr_path = stream_path + '.ovr'
+    factors = _overview_factors(height, width)
+    if len(factors) > 1:
+        # Deeper levels come from the half-resolution file, never from full resolution
+        with rasterio.open(ovr_path, 'r+') as ovr:
+            ovr.build_overviews([f // 2 for f in factors[1:]], Resampling.average)
+    rasterio.shutil.copy(
+        stream_path, output_raster_path, driver='COG',
+        BLOCKSIZE=COG_BLOCKSIZE, COMPRESS='DEFLATE', PREDICTOR='YES',
+        OVERVIEWS='FORCE_USE_EXISTING', BIGTIFF='IF_SAFER', NUM_THREADS='ALL_CPUS'
+    )
+    for path in (stream_path, ovr_path):
+        if os.path.exists(path):
+            os.remove(path)
+
+def calculate_slope_horn_tiled(input_raster_path, output_raster_path, resolution, tile_size=512,
+                               workers=1, max_in_flight=None, cog=False, quantize=None):
     """
     Calculates slope from a large DEM using Horn's formula with tiling.
+
+    Args:
+        input_raster_path: Path to the DEM
+        output_raster_path: Path of the slope GeoTIFF (degrees)
+        resolution: Pixel size in map units
+        tile_size: Tile edge in pixels, snapped to the DEM's internal blocks (default 512)
+        workers: Number of threads reading and computing tiles (default 1, sequential)
+        max_in_flight: Maximum number of tiles held in memory when workers > 1 (default 2 * workers)
+        cog: Whether to write a tiled, DEFLATE-compressed Cloud-Optimized GeoTIFF with internal
+             overviews (default False: float32 copy of the DEM profile)
+        quantize: None (float32), 'uint8' or 'uint16' slope encoding; the scale is stored as
+                  band scale/offset metadata (degrees = value * scale)
+
+    Nodata (value or mask) of the DEM is written as NaN (or the top value of the quantized type),
+    and tiles without valid pixels are not computed.
+
+    In COG mode the first overview level is averaged from each tile as it is written, deeper
+    levels are built from that half-resolution level, and the final COG layout is assembled
+    from both, so full resolution is never re-read to build overviews.
     """
     start_time = time.time()
     processing_time = 0.0  # Initialize processing_time here
     print(f"Starting tiled slope calculation for: {input_raster_path}")
+    _, scale, nodata = encode_slope(np.empty((0, 0), dtype=np.float32), quantize)
 
     try:
         with rasterio.open(input_raster_path) as src:
             rows = src.height
             cols = src.width
-            profile = src.profile
-            dtype = np.float32
+            output_profile = _output_profile(src, 1)
+            if quantize is not None:
+                output_profile.update(dtype=quantize, nodata=nodata)
+
+            write_path = output_raster_path
+            if cog:
+                write_path = output_raster_path + '.stream.tif'
+                output_profile.update(
+                    driver='GTiff', tiled=True, blockxsize=COG_BLOCKSIZE, blockysize=COG_BLOCKSIZE,
+                    compress='deflate', zlevel=1, predictor=2 if quantize else 3,
+                    BIGTIFF='IF_SAFER', nodata=nodata
+                )
+                ovr_profile = output_profile.copy()
+                ovr_profile.update(
+                    height=(rows + 1) // 2, width=(cols + 1) // 2,
+                    transform=src.transform * Affine.scale(2)
+                )
+
+            with ExitStack() as stack:
+                dst = stack.enter_context(rasterio.open(write_path, 'w', **output_profile))
+                ovr = stack.enter_context(rasterio.open(write_path + '.ovr', 'w', **ovr_profile)) if cog else None
+                for target in (dst, ovr):
+                    if target is not None and quantize is not None:
+                        target.scales = (scale,)
+                        target.offsets = (0.0,)
+                        target.update_tags(1, SLOPE_ENCODING=quantize, SLOPE_UNITS='degrees')
+
+                grid = plan_tile_grid(src, tile_size, even=cog)
+                tile_shape = grid[0][1].height, grid[0][1].width
+                print(f"Processing {rows}x{cols} raster in {tile_shape[0]}x{tile_shape[1]} tiles "
+                      f"({workers or 1} worker(s))...")
+
+                compute = partial(_slope_tile, resolution=resolution)
+                skipped = 0
+                for (_, write_window, _), data_to_write in iter_tile_results(
+                        src, input_raster_path, grid, compute, workers, max_in_flight):
+                    # Single writer: tiles arrive in grid order from the (optional) pool
+                    if data_to_write is None:
+                        data_to_write = _nodata_fill(write_window)
+                        skipped += 1
+                    dst.write(encode_slope(data_to_write, quantize)[0], 1, window=write_window)
+
+                    if ovr is not None:
+                        # Tiles start on even offsets, so the 2x2 blocks never straddle tiles
+                        half = _downsample2(data_to_write)
+                        ovr_window = Window(write_window.col_off // 2, write_window.row_off // 2,
+                                            half.shape[1], half.shape[0])
+                        ovr.write(encode_slope(half, quantize)[0], 1, window=ovr_window)
+
+                    row_start, col_start = write_window.row_off, write_window.col_off
+                    print(f"Processed tile: row {row_start}-{row_start + write_window.height}, "
+                          f"col {col_start}-{col_start + write_window.width}", end='\r')
+
+                print(f"\nTiled processing complete ({skipped} of {len(grid)} tiles were nodata only).")
 
-            output_profile = profile.copy()
-            output_profile.update(dtype=rasterio.float32, count=1)
+            if cog:
+                print("Writing Cloud-Optimized GeoTIFF...")
+                _finalize_cog(write_path, output_raster_path, quantize)
 
-            with rasterio.open(output_raster_path, 'w', **output_profile) as dst:
-                print(f"Processing {rows}x{cols} raster in {tile_size}x{tile_size} tiles...")
+    except rasterio.RasterioIOError as e:
+        print(f"Error opening raster file: {e}")
+    except Exception as e:
+        print(f"An unexpected error occurred: {e}")
 
-                for row_start in range(0, rows, tile_size):
-                    row_end = min(row_start + tile_size, rows)
-                    for col_start in range(0, cols, tile_size):
-                        col_end = min(col_start + tile_size, cols)
+    end_time = time.time()
+    processing_time = end_time - start_time
+    print(f"Total processing time: {processing_time:.2f} seconds.")
 
-                        # Read tile with buffer
-                        buffer = 1
-                        tile_row_start = max(0, row_start - buffer)
-                        tile_row_end = min(rows, row_end + buffer)
-                        tile_col_start = max(0, col_start - buffer)
-                        tile_col_end = min(cols, col_end + buffer)
+def terrain_derivatives(input_raster_path, outputs, resolution=None, tile_size=512, workers=1,
+                        max_in_flight=None, azimuth=315.0, altitude=45.0):
+    """
+    Computes several terrain derivatives of a DEM in one tiled pass (each buffered window is read once).
 
-                        window = rasterio.windows.Window(tile_col_start, tile_row_start,
-                                                         tile_col_end - tile_col_start,
-                                                         tile_row_end - tile_row_start)
-                        tile_elevation = src.read(1, window=window).astype(dtype)
+    Args:
+        input_raster_path: Path to the DEM
+        outputs: Dict product -> output GeoTIFF path, products from TERRAIN_PRODUCTS
+                 ('slope', 'aspect', 'hillshade', 'curvature', 'tri', 'tpi').
+                 Products sharing a path are written as bands of one file, in dict order.
+        resolution: Pixel size in map units (default: taken from the DEM)
+        tile_size: Tile edge in pixels, snapped to the DEM's internal blocks (default 512)
+        workers: Number of threads reading and computing tiles (default 1, sequential)
+        max_in_flight: Maximum number of tiles held in memory when workers > 1 (default 2 * workers)
+        azimuth: Sun azimuth for hillshade in degrees (default 315)
+        altitude: Sun altitude for hillshade in degrees (default 45)
 
-                        # Apply Horn's formula
-                        dzdx_kernel = np.array([[-1, 0, 1], [-2, 0, 2], [-1, 0, 1]]) / (8 * resolution)
-                        dzdy_kernel = np.array([[1, 2, 1], [0, 0, 0], [-1, -2, -1]]) / (8 * resolution)
-                        dzdx_tile = convolve(tile_elevation, dzdx_kernel, mode='constant', cval=np.nan)
-                        dzdy_tile = convolve(tile_elevation, dzdy_kernel, mode='constant', cval=np.nan)
-                        slope_rad_tile = np.arctan(np.sqrt(dzdx_tile**2 + dzdy_tile**2))
-                        slope_deg_tile = np.degrees(slope_rad_tile)
+    Returns:
+        Float32 GeoTIFFs saved at the given paths (band descriptions hold the product names).
+    """
+    unknown = set(outputs) - set(TERRAIN_PRODUCTS)
+    if unknown:
+        raise ValueError(
+            f"Unsupported terrain product(s): {', '.join(sorted(unknown))}. "
+            f"Supported: {', '.join(TERRAIN_PRODUCTS)}"
+        )
+    products = tuple(outputs)
 
-                        # Define the write window (original tile boundaries)
-                        write_window = rasterio.windows.Window(col_start, row_start,
-                                                               col_end - col_start,
-                                                               row_end - row_start)
+    # Group products per output file -> band order
+    bands = {}
+    for name, path in outputs.items():
+        bands.setdefault(path, []).append(name)
 
-                        # Define the slice of the *processed* tile to write
-                        write_row_start = buffer if row_start > 0 else 0
-                        write_row_end = slope_deg_tile.shape[0] - buffer if row_end < rows else slope_deg_tile.shape[0]
-                        write_col_start = buffer if col_start > 0 else 0
-                        write_col_end = slope_deg_tile.shape[1] - buffer if col_end < cols else slope_deg_tile.shape[1]
+    start_time = time.time()
+    print(f"Starting tiled terrain derivatives ({', '.join(products)}) for: {input_raster_path}")
 
-                        data_to_write = slope_deg_tile[write_row_start:write_row_end,
-                                                       write_col_start:write_col_end]
+    try:
+        with rasterio.open(input_raster_path) as src:
+            rows = src.height
+            cols = src.width
+            if resolution is None:
+                resolution = src.res[0]
 
-                        dst.write(data_to_write, 1, window=write_window)
+            with ExitStack() as stack:
+                targets = {}
+                for path, names in bands.items():
+                    output_profile = _output_profile(src, len(names))
+                    dst = stack.enter_context(rasterio.open(path, 'w', **output_profile))
+                    for band, name in enumerate(names, start=1):
+                        dst.set_band_description(band, name)
+                        targets[name] = (dst, band)
 
-                        print(f"Processed tile: row {row_start}-{row_end}, col {col_start}-{col_end}", end='\r')
+                grid = plan_tile_grid(src, tile_size)
+                tile_shape = grid[0][1].height, grid[0][1].width
+                print(f"Processing {rows}x{cols} raster in {tile_shape[0]}x{tile_shape[1]} tiles "
+                      f"({workers or 1} worker(s))...")
 
-                print("\nTiled processing complete.")
+                compute = partial(_terrain_tile, resolution=resolution, products=products,
+                                  azimuth=azimuth, altitude=altitude)
+                skipped = 0
+                for (_, write_window, _), results in iter_tile_results(
+                        src, input_raster_path, grid, compute, workers, max_in_flight):
+                    if results is None:
+                        results = dict.fromkeys(products, _nodata_fill(write_window))
+                        skipped += 1
+                    for name, data_to_write in results.items():
+                        dst, band = targets[name]
+                        dst.write(data_to_write, band, window=write_window)
+
+                    row_start, col_start = write_window.row_off, write_window.col_off
+                    print(f"Processed tile: row {row_start}-{row_start + write_window.height}, "
+                          f"col {col_start}-{col_start + write_window.width}", end='\r')
+
+                print(f"\nTiled processing complete ({skipped} of {len(grid)} tiles were nodata only).")
 
     except rasterio.RasterioIOError as e:
         print(f"Error opening raster file: {e}")
     except Exception as e:
         print(f"An unexpected error occurred: {e}")
 
-    end_time = time.time()
-    processing_time = end_time - start_time
-    print(f"Total processing time: {processing_time:.2f} seconds.")
+    print(f"Total processing time: {time.time() - start_time:.2f} seconds.")
+
+def benchmark_horn(tile_size=512, n_tiles=16, resolution=1.0, seed=0):
+    """
+    Compares per-tile throughput of horn_slope against the former convolve implementation.
+
+    Args:
+        tile_size: Tile edge in pixels (a one-pixel buffer is added as in the tiled loop)
+        n_tiles: Number of synthetic buffered tiles to time
+        resolution: Pixel size passed to both engines
+        seed: Seed of the synthetic DEM
+
+    Returns:
+        Dict with seconds per megapixel of each engine, speed-up and max absolute difference (degrees).
+    """
+    rng = np.random.default_rng(seed)
+    shape = (tile_size + 2 * HORN_BUFFER, tile_size + 2 * HORN_BUFFER)
+    tiles = [np.cumsum(rng.normal(0, 0.5, shape), axis=1).astype(np.float32) for _ in range(n_tiles)]
+    megapixels = n_tiles * tile_size * tile_size / 1e6
+
+    t0 = time.perf_counter()
+    reference = [_horn_slope_convolve(tile, resolution) for tile in tiles]
+    t_convolve = time.perf_counter() - t0
+
+    workspace = horn_workspace(shape)
+    max_diff = 0.0
+    t_shifted = 0.0
+    for tile, ref in zip(tiles, reference):
+        t0 = time.perf_counter()
+        result = horn_slope(tile, resolution, workspace)
+        t_shifted += time.perf_counter() - t0
+        max_diff = max(max_diff, float(np.nanmax(np.abs(result - ref))))
+
+    summary = {
+        'convolve_s_per_mpx': t_convolve / megapixels,
+        'shifted_s_per_mpx': t_shifted / megapixels,
+        'speedup': t_convolve / t_shifted,
+        'max_abs_diff_deg': max_diff
+    }
+    print(f"convolve: {summary['convolve_s_per_mpx'] * 1000:.1f} ms/MPx | "
+          f"shifted slices: {summary['shifted_s_per_mpx'] * 1000:.1f} ms/MPx | "
+          f"speed-up x{summary['speedup']:.1f} | max |diff| {max_diff:.2e} deg")
+    return summary
 
 # Example usage:
-input_dem_file = ".../03 Planning/1232-T2-TM2_1-GIS-Remote-Sensing/06_GIS-Data/17_DEMfromALS/DEMfromALS_1m.tif"
-output_slope_file = ".../03 Planning/1232-T2-TM2_1-GIS-Remote-Sensing/06_GIS-Data/17_DEMfromALS/DEMfromALS_1m_SLOPE.tif"
-dem_resolution = 1.0
-tile_size_pixels = 512
+if __name__ == "__main__":
+    input_dem_file = ".../03 Planning/1232-T2-TM2_1-GIS-Remote-Sensing/06_GIS-Data/17_DEMfromALS/DEMfromALS_1m.tif"
+    output_slope_file = ".../03 Planning/1232-T2-TM2_1-GIS-Remote-Sensing/06_GIS-Data/17_DEMfromALS/DEMfromALS_1m_SLOPE.tif"
+    dem_resolution = 1.0
+    tile_size_pixels = 512
 
-calculate_slope_horn_tiled(input_dem_file, output_slope_file, dem_resolution, tile_size_pixels)
+    calculate_slope_horn_tiled(input_dem_file, output_slope_file, dem_resolution, tile_size_pixels)
@@ -1,8 +1,12 @@
 import geopandas as gpd
-from shapely.geometry import Polygon
+from shapely.geometry import Polygon, box
+import shapely
 import itertools
 import concurrent.futures
+from multiprocessing.shared_memory import SharedMemory
+import numpy as np
 import pandas as pd
+import pyogrio
 import os
 
 def create_tiles(polygon, num_tiles_x, num_tiles_y):
@@ -23,39 +27,290 @@ def create_tiles(polygon, num_tiles_x, num_tiles_y):
             tiles.append(tile)
     return gpd.GeoDataFrame({'geometry': tiles}, crs=polygon.crs)
 
-def process_tile(tile, large_polygon):
-    """Processes a single tile by intersecting it with the large polygon."""
-    tile_bbox = tile.geometry.bounds
-    print(f"Processing tile with bounding box: {tile_bbox}")  # Added print statement
-    possible_intersections = large_polygon.cx[tile_bbox[0]:tile_bbox[2], tile_bbox[1]:tile_bbox[3]]
-    intersection = gpd.overlay(possible_intersections, gpd.GeoDataFrame({'geometry': [tile.geometry]}, crs=large_polygon.crs), how='intersection')
-    return intersection
+def _bbox_share(bounds, cell):
+    """Share of every bounding box that lies inside `cell` (per-axis overlap; 1 along degenerate axes)."""
+    minx, miny, maxx, maxy = cell
+    width, height = bounds[:, 2] - bounds[:, 0], bounds[:, 3] - bounds[:, 1]
+    overlap_x = np.minimum(bounds[:, 2], maxx) - np.maximum(bounds[:, 0], minx)
+    overlap_y = np.minimum(bounds[:, 3], maxy) - np.maximum(bounds[:, 1], miny)
+    share_x = np.divide(overlap_x, width, out=np.ones_like(width), where=width > 0)
+    share_y = np.divide(overlap_y, height, out=np.ones_like(height), where=height > 0)
+    return np.clip(share_x, 0, 1) * np.clip(share_y, 0, 1)
 
-def tile_intersect(large_polygon_path, small_polygon_path, num_tiles_x=10, num_tiles_y=10, output_path="intersection_result.shp", use_parallel=True):
+def quadtree_tiles(feature_bounds, extent, weights=None, max_weight=50_000, max_features=2_000, max_depth=6, crs=None):
     """
-    Intersects a large polygon with a smaller polygon using tile processing.
+    Density-adaptive tiles: splits the extent recursively into quadrants until every cell holds
+    at most `max_weight` (e.g. vertices) and `max_features` features, dropping empty cells.
+
+    A feature counts for every cell its bounding box overlaps, so no cell holding part of a
+    feature is ever dropped; its weight is shared out by the part of its bounding box inside
+    the cell, so one huge feature ends up in a few cells instead of forcing splits down to
+    `max_depth`. A cell whose split leaves every quadrant with all of its features is not split.
+
+    Args:
+        feature_bounds: (n, 4) array of feature bounds (minx, miny, maxx, maxy)
+        extent: Bounds of the area to tile
+        weights: Work per feature, e.g. its vertex count (default 1 per feature)
+        max_weight: Maximum total weight per cell
+        max_features: Maximum number of features per cell
+        max_depth: Maximum number of splits (cells stop splitting there regardless of load, default 6, i.e. at most 4096 tiles)
+        crs: CRS of the returned GeoDataFrame
+
+    Returns:
+        GeoDataFrame of tiles with 'features' and 'weight' columns, largest weight first.
+    """
+    feature_bounds = np.asarray(feature_bounds, dtype=float).reshape(-1, 4)
+    weights = np.ones(len(feature_bounds)) if weights is None else np.asarray(weights, dtype=float)
+
+    def overlapping(cell, idx):
+        b = feature_bounds[idx]
+        return idx[(b[:, 0] <= cell[2]) & (b[:, 2] >= cell[0]) & (b[:, 1] <= cell[3]) & (b[:, 3] >= cell[1])]
+
+    cells = []
+    root = tuple(extent)
+    stack = [(root, overlapping(root, np.arange(len(feature_bounds))), 0)]
+    while stack:
+        cell, idx, depth = stack.pop()
+        if idx.size == 0:
+            continue
+        weight = (weights[idx] * _bbox_share(feature_bounds[idx], cell)).sum()
+        if (weight <= max_weight and idx.size <= max_features) or depth >= max_depth:
+            cells.append((box(*cell), idx.size, weight))
+            continue
+        minx, miny, maxx, maxy = cell
+        midx, midy = (minx + maxx) / 2, (miny + maxy) / 2
+        quadrants = [(minx, miny, midx, midy), (midx, miny, maxx, midy),
+                     (minx, midy, midx, maxy), (midx, midy, maxx, maxy)]
+        children = [(quadrant, overlapping(quadrant, idx)) for quadrant in quadrants]
+        # Splitting only pays off if some quadrant gets fewer features or a smaller share of them
+        if weight <= max_weight and all(child.size in (0, idx.size) for _, child in children):
+            cells.append((box(*cell), idx.size, weight))
+            continue
+        stack.extend((quadrant, child, depth + 1) for quadrant, child in children)
+
+    tiles = gpd.GeoDataFrame(
+        {'features': [c[1] for c in cells], 'weight': [c[2] for c in cells]},
+        geometry=[c[0] for c in cells], crs=crs
+    )
+    return tiles.sort_values('weight', ascending=False, kind="stable").reset_index(drop=True)
+
+_WORKER = {}
+
+def share_geometries(geoms):
+    """
+    Packs geometries as WKB into one shared memory block.
+
+    Returns (SharedMemory, offsets): feature i is shm.buf[offsets[i]:offsets[i + 1]]. The caller
+    closes and unlinks the block once the workers are done.
+    """
+    wkb = shapely.to_wkb(np.asarray(geoms, dtype=object))
+    offsets = np.zeros(len(wkb) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in wkb], out=offsets[1:])
+    shm = SharedMemory(create=True, size=max(1, int(offsets[-1])))
+    shm.buf[:offsets[-1]] = b"".join(wkb)
+    return shm, offsets
+
+def _attach_geometries(shm_name, offsets):
+    """Decodes the geometries of a block written by share_geometries."""
+    # Only this worker's mapping is closed here; tile_intersect unlinks the block after the pool
+    shm = SharedMemory(name=shm_name)
+    buf = shm.buf
+    geoms = shapely.from_wkb([bytes(buf[offsets[i]:offsets[i + 1]]) for i in range(len(offsets) - 1)])
+    del buf
+    shm.close()
+    return geoms
+
+def _init_intersect_worker(large, small):
+    """
+    Pool initializer: loads both layers once per worker.
+
+    `large` is either {'path', 'bbox'} (the worker reads the features within bbox from disk) or
+    {'shm_name', 'offsets', 'attributes'} (WKB block shared by the parent); `small` is always
+    {'shm_name', 'offsets', 'ids'}, its attributes stay with the parent.
+    """
+    if 'path' in large:
+        layer = gpd.read_file(large['path'], bbox=large['bbox'], fid_as_index=True)
+        large_geoms, attributes = layer.geometry.values.to_numpy(), pd.DataFrame(layer.drop(columns=layer.geometry.name))
+    else:
+        large_geoms, attributes = _attach_geometries(large['shm_name'], large['offsets']), large['attributes']
+    _set_worker_layers(large_geoms, attributes, _attach_geometries(small['shm_name'], small['offsets']), small['ids'])
+
+def _set_worker_layers(large_geoms, large_attributes, small_geoms, small_ids):
+    """Keeps both layers (prepared geometries, STRtrees, source IDs) for process_tile."""
+    shapely.prepare(large_geoms)
+    shapely.prepare(small_geoms)
+    _WORKER.update(
+        large=large_geoms, large_attributes=large_attributes, large_tree=shapely.STRtree(large_geoms),
+        small=small_geoms, small_ids=np.asarray(small_ids), small_tree=shapely.STRtree(small_geoms),
+    )
+
+def process_tile(task):
+    """
+    Intersects the two layers within one tile.
+
+    Candidate pairs come from the STRtrees. Pairs where one feature contains the other take a
+    fast path: the contained feature is the result as it is (no clipping), emitted only by the
+    tile owning its representative point. All other pairs are clipped to the tile and
+    intersected in one vectorized call; their pieces are re-merged by source IDs afterwards.
+
+    Args:
+        task: (tile WKB, closed_x, closed_y); tiles own points on their min edges, and on their
+              max edges only where these are closed (max edge of the whole extent)
+
+    Returns:
+        (WKB array of the pieces, DataFrame of their large-layer attributes, small-layer IDs)
+    """
+    tile_wkb, closed_x, closed_y = task
+    tile = shapely.from_wkb(tile_wkb)
+    large, small = _WORKER['large'], _WORKER['small']
+
+    # Candidate pairs: large features in the tile x small features they intersect
+    in_tile = _WORKER['large_tree'].query(tile, predicate="intersects")
+    pair_large, pair_small = _WORKER['small_tree'].query(large[in_tile], predicate="intersects")
+    pair_large = in_tile[pair_large]
+    keep = shapely.intersects(small[pair_small], tile)
+    pair_large, pair_small = pair_large[keep], pair_small[keep]
+
+    # Fast path: containment (prepared geometries), owned by the tile holding the contained feature's point
+    small_inside = shapely.contains(large[pair_large], small[pair_small])
+    contains = small_inside | shapely.contains(small[pair_small], large[pair_large])
+    contained = np.where(small_inside, small[pair_small], large[pair_large])
+    fast = contains.copy()
+    if contains.any():
+        x, y = shapely.get_coordinates(shapely.point_on_surface(contained[contains])).T
+        minx, miny, maxx, maxy = tile.bounds
+        fast[contains] = ((x >= minx) & ((x < maxx) | (closed_x & (x == maxx))) &
+                          (y >= miny) & ((y < maxy) | (closed_y & (y == maxy))))
+
+    # Everything else: clip each feature to the tile once, then intersect the pairs vectorized
+    rest = ~contains
+    pieces = np.empty(pair_large.size, dtype=object)
+    pieces[fast] = contained[fast]
+    if rest.any():
+        ul, large_pos = np.unique(pair_large[rest], return_inverse=True)
+        us, small_pos = np.unique(pair_small[rest], return_inverse=True)
+        pieces[rest] = polygonal(shapely.intersection(shapely.intersection(large[ul], tile)[large_pos],
+                                                      shapely.intersection(small[us], tile)[small_pos]))
+
+    keep = fast | rest
+    keep[keep] = np.isin(shapely.get_type_id(pieces[keep]), (3, 6)) & ~shapely.is_empty(pieces[keep])  # Polygon, MultiPolygon
+    attributes = _WORKER['large_attributes'].iloc[pair_large[keep]]
+    attributes = attributes.rename_axis('LARGE_ID').reset_index()
+    return shapely.to_wkb(pieces[keep]), attributes, _WORKER['small_ids'][pair_small[keep]]
+
+def polygonal(geoms):
+    """Keeps the polygonal part of every geometry (collections from touching edges lose their lines and points)."""
+    geoms = np.asarray(geoms, dtype=object).copy()
+    for i in np.flatnonzero(shapely.get_type_id(geoms) == 7):  # GeometryCollection
+        parts = shapely.get_parts(geoms[i])
+        parts = parts[np.isin(shapely.get_type_id(parts), (3, 6))]
+        geoms[i] = shapely.union_all(parts) if parts.size else shapely.Polygon()
+    return geoms
+
+def remerge_pieces(pieces):
+    """Unions pieces of the same (LARGE_ID, SMALL_ID) pair that were split at tile edges."""
+    keys = ['LARGE_ID', 'SMALL_ID']
+    split = pieces.duplicated(keys, keep=False)
+    if not split.any():
+        return pieces.reset_index(drop=True)
+    parts = pieces[split]
+    unions = {key: shapely.union_all(group.geometry.values) for key, group in parts.groupby(keys, sort=False)}
+    merged = parts.drop_duplicates(keys).copy()
+    merged[merged.geometry.name] = [unions[key] for key in zip(merged['LARGE_ID'], merged['SMALL_ID'])]
+    print(f"Re-merged {split.sum()} tile pieces into {len(merged)} features")
+    return pd.concat([pieces[~split], merged], ignore_index=True)
+
+def tile_intersect(large_polygon_path, small_polygon_path, num_tiles_x=10, num_tiles_y=10, output_path="intersection_result.shp", use_parallel=True, broadcast="shared",
+                   tiling="quadtree", max_vertices=50_000, max_features=2_000):
+    """
+    Intersects a large polygon layer with a smaller polygon layer using tile processing.
+
+    Both layers reach every worker once (pool initializer), never per tile: tasks carry only the
+    tile geometry as WKB and return WKB plus attributes (see process_tile). The output holds
+    the attributes of both layers (names present in both get the suffixes _1 and _2, as in
+    geopandas.overlay) and the source feature IDs LARGE_ID and SMALL_ID; pieces split at tile
+    edges are merged back into one feature per source pair.
 
     Args:
         large_polygon_path (str): Path to the large polygon shapefile (.shp).
         small_polygon_path (str): Path to the smaller polygon shapefile (.shp).
-        num_tiles_x (int): Number of tiles to divide the smaller polygon into along the x-axis.
-        num_tiles_y (int): Number of tiles to divide the smaller polygon into along the y-axis.
+        num_tiles_x (int): Number of tiles to divide the smaller polygon into along the x-axis (tiling="grid").
+        num_tiles_y (int): Number of tiles to divide the smaller polygon into along the y-axis (tiling="grid").
         output_path (str): Path to save the resulting intersection shapefile (.shp).
         use_parallel (bool): Whether to use parallel processing for the tile intersections.
+        broadcast (str): How workers get the large layer: "shared" (default) reads it once in the
+            parent and shares its WKB through shared memory; "file" lets every worker read it from
+            disk, limited to the bbox of the smaller polygon.
+        tiling (str): "quadtree" (default) splits the extent adaptively by the large layer's density
+            (see quadtree_tiles), drops empty cells and runs the heaviest tiles first; "grid" uses the
+            fixed num_tiles_x x num_tiles_y grid of create_tiles.
+        max_vertices (int): Maximum large-layer vertices per quadtree tile ("shared" broadcast only,
+            "file" broadcast counts features from the bounds index).
+        max_features (int): Maximum large-layer features per quadtree tile.
     """
+    if broadcast not in ("shared", "file"):
+        raise ValueError(f"Unsupported broadcast mode '{broadcast}'. Supported: shared, file")
+    if tiling not in ("quadtree", "grid"):
+        raise ValueError(f"Unsupported tiling '{tiling}'. Supported: quadtree, grid")
+    shm = small_shm = None
     try:
         
-        large_polygon = gpd.read_file(large_polygon_path) 
-        print("Polygon 1 is successfully read")
-        small_polygon = gpd.read_file(small_polygon_path)
+        small_polygon = gpd.read_file(small_polygon_path, fid_as_index=True)
         print("Polygon 2 is successfully read")
+        large_crs = pyogrio.read_info(large_polygon_path)["crs"]
 
         # Ensure both GeoDataFrames have the same CRS
-        if large_polygon.crs != small_polygon.crs:
+        if large_crs is not None and not small_polygon.crs.equals(large_crs):
             print("Warning: Coordinate Reference Systems do not match. Reprojecting small polygon to match large polygon.")
-            small_polygon = small_polygon.to_crs(large_polygon.crs)
+            small_polygon = small_polygon.to_crs(large_crs)
+
+        extent = tuple(small_polygon.total_bounds)
+        small_geoms = small_polygon.geometry.values.to_numpy()
+        small_ids = small_polygon.index.to_numpy()
+        if broadcast == "shared":
+            large_polygon = gpd.read_file(large_polygon_path, bbox=extent, fid_as_index=True)
+            print("Polygon 1 is successfully read")
+            large_geoms = large_polygon.geometry.values.to_numpy()
+            attributes = pd.DataFrame(large_polygon.drop(columns=large_polygon.geometry.name))
+            # Tile density: vertices of the large layer
+            feature_bounds, weights = shapely.bounds(large_geoms), shapely.get_num_coordinates(large_geoms)
+            if use_parallel:
+                shm, offsets = share_geometries(large_geoms)
+                large = {'shm_name': shm.name, 'offsets': offsets, 'attributes': attributes}
+            else:
+                _set_worker_layers(large_geoms, attributes, small_geoms, small_ids)
+            del large_polygon
+        else:
+            # Tile density: feature bounds only, the geometries are read by the workers
+            _, feature_bounds = pyogrio.read_bounds(large_polygon_path, bbox=extent)
+            feature_bounds, weights = feature_bounds.T, None
+            large = {'path': large_polygon_path, 'bbox': extent}
+        if use_parallel:
+            small_shm, small_offsets = share_geometries(small_geoms)
+            initargs = (large, {'shm_name': small_shm.name, 'offsets': small_offsets, 'ids': small_ids})
+        elif broadcast == "file":
+            layer = gpd.read_file(large_polygon_path, bbox=extent, fid_as_index=True)
+            _set_worker_layers(layer.geometry.values.to_numpy(), pd.DataFrame(layer.drop(columns=layer.geometry.name)),
+                               small_geoms, small_ids)
+
+        if tiling == "quadtree":
+            tiles = quadtree_tiles(feature_bounds, extent, weights, max_vertices, max_features, crs=large_crs)
+        else:
+            tiles = create_tiles(small_polygon, num_tiles_x, num_tiles_y)
+        # Tiles without any small-layer feature cannot produce an intersection
+        tiles = tiles.iloc[np.unique(shapely.STRtree(small_geoms).query(tiles.geometry.values, predicate="intersects")[0])]
+        if tiling == "quadtree" and len(tiles):
+            print(f"Quadtree tiling: {len(tiles)} tiles, heaviest {tiles['weight'].max():.0f}, "
+                  f"median {tiles['weight'].median():.0f}")
+        # A tile is closed on the extent's max edges only. The tolerance is absolute and tiny relative
+        # to the span: a relative one on projected coordinates (metres at ~1e6) would also close
+        # interior tiles near the edge and emit features on their shared edge twice
+        tile_bounds = shapely.bounds(tiles.geometry.values)
+        span_x, span_y = extent[2] - extent[0], extent[3] - extent[1]
+        tasks = list(zip(shapely.to_wkb(tiles.geometry.values.to_numpy()),
+                         np.isclose(tile_bounds[:, 2], extent[2], rtol=0, atol=1e-9 * span_x),
+                         np.isclose(tile_bounds[:, 3], extent[3], rtol=0, atol=1e-9 * span_y)))
 
-        tiles = create_tiles(small_polygon, num_tiles_x, num_tiles_y)
         intersected_parts = []
 
         if use_parallel:
@@ -63,21 +318,33 @@ def tile_intersect(large_polygon_path, small_polygon_path, num_tiles_x=10, num_t
             if num_cores <= 0:
                 num_cores = 1  # Ensure at least one core is used
             print(f"Using parallel processing with {num_cores} cores.")
-            with concurrent.futures.ProcessPoolExecutor(max_workers=num_cores) as executor:
-                futures = [executor.submit(process_tile, tile, large_polygon) for _, tile in tiles.iterrows()]
+            with concurrent.futures.ProcessPoolExecutor(max_workers=num_cores, initializer=_init_intersect_worker,
+                                                        initargs=initargs) as executor:
+                # Submitted in tile order, i.e. heaviest first for quadtree tiles
+                futures = [executor.submit(process_tile, task) for task in tasks]
                 for future in concurrent.futures.as_completed(futures):
-                    result = future.result()
-                    if not result.empty:
-                        intersected_parts.append(result)
+                    intersected_parts.append(future.result())
         else:
             print("Using sequential processing.")
-            for _, tile in tiles.iterrows():
-                intersection = process_tile(tile, large_polygon)
-                if not intersection.empty:
-                    intersected_parts.append(intersection)
+            for task in tasks:
+                intersected_parts.append(process_tile(task))
 
+        intersected_parts = [part for part in intersected_parts if len(part[0])]
         if intersected_parts:
-            final_intersection = gpd.GeoDataFrame(pd.concat(intersected_parts, ignore_index=True), crs=large_polygon.crs)
+            large_attributes = pd.concat([attrs for _, attrs, _ in intersected_parts], ignore_index=True)
+            piece_small_ids = np.concatenate([ids for _, _, ids in intersected_parts])
+            small_attributes = pd.DataFrame(small_polygon.drop(columns=small_polygon.geometry.name)).loc[piece_small_ids]
+            # Attribute names present in both layers get the overlay suffixes
+            common = (set(large_attributes.columns) - {'LARGE_ID'}) & set(small_attributes.columns)
+            large_attributes = large_attributes.rename(columns={c: f"{c}_1" for c in common})
+            small_attributes = small_attributes.rename(columns={c: f"{c}_2" for c in common})
+            small_attributes = small_attributes.rename_axis('SMALL_ID').reset_index()
+            final_intersection = gpd.GeoDataFrame(
+                pd.concat([large_attributes, small_attributes], axis=1),
+                geometry=shapely.from_wkb(np.concatenate([wkb for wkb, _, _ in intersected_parts])),
+                crs=large_crs
+            )
+            final_intersection = remerge_pieces(final_intersection)
             print(f"Number of intersected features: {len(final_intersection)}")
             final_intersection.to_file(output_path)  # geopandas automatically infers the driver from the file extension
             print(f"Intersection results saved to: {output_path}")
@@ -88,6 +355,11 @@ def tile_intersect(large_polygon_path, small_polygon_path, num_tiles_x=10, num_t
         print("Error: One or both of the input file paths are incorrect.")
     except Exception as e:
         print(f"An error occurred: {e}")
+    finally:
+        for block in (shm, small_shm):
+            if block is not None:
+                block.close()
+                block.unlink()
 
 # Example usage:
 if __name__ == "__main__":